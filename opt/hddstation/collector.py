@@ -0,0 +1,447 @@
+#!/usr/bin/python3
+
+#Modules
+import argparse
+import collections
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zlib
+
+#Multi-station collector
+#Every station's results used to stay on its own screen.  Now each station can push verdicts, wipe completions and stage
+#timings to one collector, which merges them per serial and answers fleet-wide questions (throughput per station, failure
+#rate per profile, where has this serial been).
+#
+#Protocol: every frame is an 8-byte header - magic 'HS', version, frame type, payload length (network order) - followed
+#by the payload.  PUSH payloads are zlib'd JSON batches ({'station': name, 'records': [...]}); everything else is plain JSON.
+#The collector answers every PUSH with an ACK and every QUERY with a RESULT (or an ERROR).
+#Addresses are 'unix:/path/to/socket' or 'tcp:host:port'.
+#
+#Stations batch records and push them every few seconds.  If the collector is down, batches are spooled to disk and sent
+#ahead of the next batch once it's back.
+#
+#Usage:
+#	collector.py serve --listen unix:/run/hddstation/collector.sock --state /var/lib/hddstation/fleet.json
+#	collector.py query stations --connect unix:/run/hddstation/collector.sock
+#	collector.py query failure_rate --connect tcp:collector:7420
+#	collector.py query drive --serial WD-WMC1234 --connect tcp:collector:7420
+#	collector.py push verdict serial=ABC profile=SATA verdict=PASS --station test1 --connect ...	(for scripts and testing)
+
+frameHeader = struct.Struct('!2sBBI')
+frameMagic = b'HS'
+frameVersion = 1
+framePush = 1
+frameAck = 2
+frameQuery = 3
+frameResult = 4
+frameError = 5
+maxFrame = 64 * 1024 * 1024		#refuse anything bigger than this - it's not from one of ours
+maxBatch = 5000								#records per PUSH frame
+throughputWindow = 3600				#seconds of history 'stations' rates are worked out over
+historyLength = 100000				#timestamps kept per station per kind, for the rates
+
+
+#Helper functions
+class protocolError(Exception): #Raised on frames that aren't ours
+	pass
+
+def packFrame(frameType, payload): #Returns header + payload bytes
+	return frameHeader.pack(frameMagic, frameVersion, frameType, len(payload)) + payload
+
+def readExactly(stream, count): #Reads exactly count bytes, or returns None at a clean EOF
+	data = b''
+	while len(data) < count:
+		chunk = stream.read(count - len(data))
+		if not chunk:
+			if data:
+				raise protocolError('connection closed mid-frame')
+			return None
+		data += chunk
+	return data
+
+def readFrame(stream): #Returns (frameType, payload), or None at EOF
+	header = readExactly(stream, frameHeader.size)
+	if header is None:
+		return None
+	magic, version, frameType, length = frameHeader.unpack(header)
+	if magic != frameMagic or version != frameVersion:
+		raise protocolError('bad frame header')
+	if length > maxFrame:
+		raise protocolError('frame too big')
+	payload = readExactly(stream, length) if length else b''
+	if payload is None:
+		raise protocolError('connection closed mid-frame')
+	return frameType, payload
+
+def encodeJSON(thing):
+	return json.dumps(thing, separators=(',', ':')).encode('utf-8')
+
+def decodeJSON(payload):
+	return json.loads(payload.decode('utf-8'))
+
+def parseAddress(address): #'unix:/path' -> (AF_UNIX, '/path'), 'tcp:host:port' -> (AF_INET, (host, port))
+	if address.startswith('unix:'):
+		return socket.AF_UNIX, address[5:]
+	if address.startswith('tcp:'):
+		address = address[4:]
+	host, port = address.rsplit(':', 1)
+	return socket.AF_INET, (host, int(port))
+
+def connect(address, timeout=10): #Returns a connected socket
+	family, target = parseAddress(address)
+	sock = socket.socket(family, socket.SOCK_STREAM)
+	sock.settimeout(timeout)
+	try:
+		sock.connect(target)
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+def request(address, frameType, payload): #Sends one frame and returns the reply frame
+	with connect(address) as sock:
+		sock.sendall(packFrame(frameType, payload))
+		with sock.makefile('rb') as stream:
+			reply = readFrame(stream)
+	if reply is None:
+		raise protocolError('collector hung up without answering')
+	return reply
+
+def query(address, name, **arguments): #Asks the collector a question and returns the answer
+	frameType, payload = request(address, frameQuery, encodeJSON(dict(arguments, query=name)))
+	if frameType == frameError:
+		raise protocolError(decodeJSON(payload).get('error', 'unknown error'))
+	return decodeJSON(payload)
+
+
+#Station side
+class stationReporter():
+	def __init__(self, address, station, spool=None, batchSize=200, flushInterval=5):
+		#address: where the collector is.  station: what to call this station.  spool: file to keep batches in while the collector is down.
+		self.address = address
+		self.station = station
+		self.spool = spool
+		self.batchSize = batchSize
+		self.flushInterval = flushInterval
+		self.pending = []
+		self.lock = threading.Lock()
+		self.flushLock = threading.Lock()
+		self.wake = threading.Event()
+		self.stopping = threading.Event()
+		self.thread = threading.Thread(target=self.loop, daemon=True)
+		self.thread.start()
+
+	def push(self, kind, **fields): #Queues a record.  Never blocks on the network.
+		record = dict(fields, type=kind)
+		record.setdefault('time', time.time())
+		with self.lock:
+			self.pending.append(record)
+			if len(self.pending) >= self.batchSize:
+				self.wake.set()
+
+	def loop(self): #Flushes every flushInterval seconds, or sooner when a batch fills up
+		while not self.stopping.is_set():
+			self.wake.wait(self.flushInterval)
+			self.wake.clear()
+			self.flush()
+
+	def stop(self): #Flushes what's left (to the collector or the spool) and stops
+		self.stopping.set()
+		self.wake.set()
+		self.thread.join()
+		self.flush()
+
+	def readSpool(self):
+		records = []
+		if self.spool and os.path.exists(self.spool):
+			with open(self.spool) as spool:
+				for line in spool:
+					try:
+						records.append(json.loads(line))
+					except ValueError:
+						pass #half-written line from a crash
+		return records
+
+	def writeSpool(self, records, replace=False): #Appends records to the spool, or with replace=True makes them all that's in it
+		if not self.spool:
+			return
+		try:
+			if replace and not records:
+				if os.path.exists(self.spool):
+					os.remove(self.spool)
+				return
+			os.makedirs(os.path.dirname(self.spool) or '.', exist_ok=True)
+			with open(self.spool, 'w' if replace else 'a') as spool:
+				for record in records:
+					spool.write(json.dumps(record) + '\n')
+		except OSError:
+			pass #nowhere to put them - they're lost, but grading carries on
+
+	def send(self, records): #Sends records in PUSH frames on one connection.  Returns how many the collector ACKed - it stops at the first batch that isn't.
+		sent = 0
+		try:
+			with connect(self.address) as sock:
+				with sock.makefile('rb') as stream:
+					for start in range(0, len(records), maxBatch):
+						batch = records[start:start + maxBatch]
+						sock.sendall(packFrame(framePush, zlib.compress(encodeJSON({'station': self.station, 'records': batch}))))
+						reply = readFrame(stream)
+						if reply is None or reply[0] != frameAck or decodeJSON(reply[1]).get('accepted') != len(batch):
+							break
+						sent += len(batch)
+		except (OSError, protocolError, ValueError):
+			pass #collector down or hung up - whatever wasn't ACKed gets spooled
+		return sent
+
+	def flush(self): #Sends the spool and everything pending, and spools whatever the collector didn't ACK
+		with self.flushLock:
+			with self.lock:
+				records = self.pending
+				self.pending = []
+			spooled = self.readSpool()
+			if not records and not spooled:
+				return
+
+			#batches the collector ACKed are merged already - sending them again would count them twice
+			records = spooled + records
+			sent = self.send(records)
+			if spooled:
+				self.writeSpool(records[sent:], replace = True)
+			elif sent < len(records):
+				self.writeSpool(records[sent:])
+
+
+#Collector side
+class fleetState():
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.drives = {}			#serial -> merged state
+		self.stations = {}		#station -> counters
+		self.history = {}			#(station, kind) -> deque of record times, for the rates
+
+	def stationCounters(self, station):
+		if station not in self.stations:
+			self.stations[station] = {'verdicts': 0, 'wipes': 0, 'wipe_failures': 0, 'wipe_seconds': 0.0, 'stage_seconds': {}, 'stage_counts': {}, 'first_seen': None, 'last_seen': None}
+		return self.stations[station]
+
+	def remember(self, station, kind, when):
+		key = station + '\0' + kind
+		if key not in self.history:
+			self.history[key] = collections.deque(maxlen=historyLength)
+		self.history[key].append(when)
+
+	def merge(self, station, records): #Folds a batch of records in.  Records can arrive late and out of order (spools), so newest wins.
+		with self.lock:
+			counters = self.stationCounters(station)
+			for record in records:
+				when = record.get('time', time.time())
+				counters['first_seen'] = min(counters['first_seen'] or when, when)
+				counters['last_seen'] = max(counters['last_seen'] or when, when)
+				kind = record.get('type')
+				serial = record.get('serial')
+
+				if kind == 'verdict':
+					counters['verdicts'] += 1
+					self.remember(station, 'verdict', when)
+					drive = self.drives.setdefault(serial, {'serial': serial, 'stations': [], 'wipes': []})
+					if station not in drive['stations']:
+						drive['stations'].append(station)
+					if when >= drive.get('time', 0):
+						drive.update({'time': when, 'station': station, 'profile': record.get('profile'), 'verdict': record.get('verdict'), 'slot': record.get('slot')})
+
+				elif kind == 'wipe':
+					if record.get('ok', True):
+						counters['wipes'] += 1
+						counters['wipe_seconds'] += record.get('seconds') or 0
+						self.remember(station, 'wipe', when)
+					else:
+						counters['wipe_failures'] += 1
+					drive = self.drives.setdefault(serial, {'serial': serial, 'stations': [], 'wipes': []})
+					drive['wipes'].append({'time': when, 'station': station, 'method': record.get('method'), 'ok': record.get('ok', True), 'seconds': record.get('seconds')})
+					drive['wipes'] = drive['wipes'][-20:]
+
+				elif kind == 'timing':
+					stage = record.get('stage', '?')
+					counters['stage_seconds'][stage] = counters['stage_seconds'].get(stage, 0) + (record.get('seconds') or 0)
+					counters['stage_counts'][stage] = counters['stage_counts'].get(stage, 0) + 1
+
+	def rate(self, station, kind, now, window): #Events per hour over the last window seconds
+		times = self.history.get(station + '\0' + kind, ())
+		recent = sum(1 for when in times if when >= now - window)
+		return round(recent * 3600.0 / window, 2)
+
+	def answer(self, question): #Works out the answer to a QUERY
+		name = question.get('query')
+		with self.lock:
+			if name == 'stations':
+				window = question.get('window', throughputWindow)
+				now = time.time()
+				answer = {}
+				for station, counters in self.stations.items():
+					answer[station] = {'verdicts': counters['verdicts'], 'wipes': counters['wipes'], 'wipe_failures': counters['wipe_failures'], 'last_seen': counters['last_seen']}
+					answer[station]['drives_per_hour'] = self.rate(station, 'verdict', now, window)
+					answer[station]['wipes_per_hour'] = self.rate(station, 'wipe', now, window)
+					answer[station]['mean_wipe_seconds'] = round(counters['wipe_seconds'] / counters['wipes'], 1) if counters['wipes'] else None
+					answer[station]['mean_stage_seconds'] = {stage: round(total / counters['stage_counts'][stage], 1) for stage, total in counters['stage_seconds'].items()}
+				return answer
+
+			if name == 'failure_rate':
+				answer = {}
+				for drive in self.drives.values():
+					if not drive.get('verdict'):
+						continue
+					profile = answer.setdefault(drive.get('profile') or '?', {'drives': 0, 'PASS': 0, 'WARN': 0, 'FAIL': 0})
+					profile['drives'] += 1
+					if drive['verdict'] in profile:
+						profile[drive['verdict']] += 1
+				for profile in answer.values():
+					profile['failure_rate'] = round(profile['FAIL'] / profile['drives'], 4)
+				return answer
+
+			if name == 'drive':
+				return self.drives.get(question.get('serial'))
+
+		raise protocolError('unknown query ' + repr(name))
+
+	def save(self, filename): #Writes the merged state out, so a restart doesn't forget the fleet
+		with self.lock:
+			state = {'drives': self.drives, 'stations': self.stations, 'history': {key: list(times) for key, times in self.history.items()}}
+			data = json.dumps(state)
+		temporary = filename + '.tmp'
+		with open(temporary, 'w') as out:
+			out.write(data)
+		os.replace(temporary, filename)
+
+	def load(self, filename):
+		with open(filename) as source:
+			state = json.load(source)
+		with self.lock:
+			self.drives = state.get('drives', {})
+			self.stations = state.get('stations', {})
+			self.history = {key: collections.deque(times, maxlen=historyLength) for key, times in state.get('history', {}).items()}
+
+
+class collectorHandler(socketserver.StreamRequestHandler): #One station (or query) connection
+	def handle(self):
+		fleet = self.server.fleet
+		while True:
+			try:
+				frame = readFrame(self.rfile)
+			except protocolError:
+				return #not one of ours, or it died mid-frame - drop it
+
+			if frame is None:
+				return
+			frameType, payload = frame
+
+			try:
+				if frameType == framePush:
+					batch = decodeJSON(zlib.decompress(payload))
+					records = batch.get('records', [])
+					fleet.merge(batch.get('station', '?'), records)
+					reply = packFrame(frameAck, encodeJSON({'accepted': len(records)}))
+				elif frameType == frameQuery:
+					reply = packFrame(frameResult, encodeJSON(fleet.answer(decodeJSON(payload))))
+				else:
+					raise protocolError('unexpected frame type ' + str(frameType))
+			except (protocolError, ValueError, zlib.error) as error:
+				reply = packFrame(frameError, encodeJSON({'error': str(error)}))
+
+			self.wfile.write(reply)
+			self.wfile.flush()
+
+
+class unixCollector(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+class tcpCollector(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+#Function to start a collector listening on address.  Returns the server; call serve_forever() on it.
+def makeCollector(address, fleet=None):
+	family, target = parseAddress(address)
+	if family == socket.AF_UNIX:
+		if os.path.exists(target):
+			os.remove(target) #stale socket from the last run
+		server = unixCollector(target, collectorHandler)
+	else:
+		server = tcpCollector(target, collectorHandler)
+	server.fleet = fleet or fleetState()
+	return server
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Hard drive station fleet collector')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	serve = commands.add_parser('serve', help='run the collector')
+	serve.add_argument('--listen', required=True, help='unix:/path or tcp:host:port')
+	serve.add_argument('--state', help='file to keep the merged fleet state in across restarts')
+	serve.add_argument('--save-interval', type=int, default=30, help='seconds between state saves')
+
+	ask = commands.add_parser('query', help='ask the collector something')
+	ask.add_argument('question', choices=['stations', 'failure_rate', 'drive'])
+	ask.add_argument('--connect', required=True)
+	ask.add_argument('--serial', help='for drive queries')
+	ask.add_argument('--window', type=int, help='seconds of history for station rates')
+
+	push = commands.add_parser('push', help='push one record, as a station would')
+	push.add_argument('kind', choices=['verdict', 'wipe', 'timing'])
+	push.add_argument('fields', nargs='*', help='key=value pairs, e.g. serial=ABC profile=SATA verdict=PASS')
+	push.add_argument('--connect', required=True)
+	push.add_argument('--station', default=socket.gethostname())
+	push.add_argument('--spool', help='spool file, if the collector might be down')
+
+	args = parser.parse_args()
+
+	if args.command == 'serve':
+		fleet = fleetState()
+		if args.state and os.path.exists(args.state):
+			fleet.load(args.state)
+		server = makeCollector(args.listen, fleet)
+		signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) #systemd stops us with TERM - still save on the way out
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		try:
+			while True:
+				time.sleep(args.save_interval)
+				if args.state:
+					fleet.save(args.state)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			server.shutdown()
+			if args.state:
+				fleet.save(args.state)
+
+	elif args.command == 'query':
+		arguments = {}
+		if args.serial:
+			arguments['serial'] = args.serial
+		if args.window:
+			arguments['window'] = args.window
+		print(json.dumps(query(args.connect, args.question, **arguments), indent=2, sort_keys=True))
+
+	elif args.command == 'push':
+		fields = {}
+		for field in args.fields:
+			key, value = field.split('=', 1)
+			try:
+				fields[key] = json.loads(value) #numbers and true/false come through as themselves
+			except ValueError:
+				fields[key] = value
+		reporter = stationReporter(args.connect, args.station, spool = args.spool)
+		reporter.push(args.kind, **fields)
+		reporter.stop()
+
+#Only run if we were explicitly called
+if __name__ == '__main__':
+	main()
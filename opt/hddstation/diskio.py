@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+
+#Modules
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import threading
+
+#Disk I/O helpers shared by the wipes (patternwipe.py, metawipe.py) and the benchmark (perftest.py)
+#	- O_DIRECT opens and aligned reads, so we're measuring (and wiping) the drive and not the page cache
+#	- shared links: the four toaster slots share one USB link, so a benchmark on it needs the link to itself.  Benchmarks
+#	  take a link with linkLock(link).exclusive(), and everything else on it (wipes) wraps each chunk of I/O in
+#	  sharingLink(link), so they pause between chunks while a benchmark runs and the benchmark waits for chunks in flight.
+
+linkLocks = {}
+linkLocksLock = threading.Lock()
+
+
+class sharedLink(): #Any number of jobs can share a link, or one benchmark can have it to itself
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.users = 0							#chunks of shared I/O in flight
+		self.benchmarking = False
+		self.waiting = 0						#benchmarks waiting for the link - new shared I/O holds off so they aren't starved
+
+	@contextlib.contextmanager
+	def shared(self): #'with link.shared():' around one chunk of I/O.  Waits while a benchmark has (or wants) the link.
+		with self.condition:
+			while self.benchmarking or self.waiting:
+				self.condition.wait()
+			self.users += 1
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.users -= 1
+				self.condition.notify_all()
+
+	@contextlib.contextmanager
+	def exclusive(self): #'with link.exclusive():' around a benchmark.  Waits for other benchmarks and for shared I/O in flight.
+		with self.condition:
+			self.waiting += 1
+			while self.benchmarking or self.users:
+				self.condition.wait()
+			self.waiting -= 1
+			self.benchmarking = True
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.benchmarking = False
+				self.condition.notify_all()
+
+
+#Helper functions
+def linkLock(link): #Returns the sharedLink for a link name, making it if we haven't seen the link before
+	with linkLocksLock:
+		if link not in linkLocks:
+			linkLocks[link] = sharedLink()
+		return linkLocks[link]
+
+@contextlib.contextmanager
+def unshared(): #Does nothing - stands in for a link when there isn't one (contextlib.nullcontext is 3.7+)
+	yield
+
+def sharingLink(link): #Returns a context manager for one chunk of ordinary I/O on a link (or nothing at all if link is None)
+	if link is None:
+		return unshared()
+	return linkLock(link).shared()
+
+
+#O_DIRECT helpers.  Buffers must be page-aligned, so make them with mmap.
+def openDirect(path, flags): #Opens with O_DIRECT if the device will have it (regular files on tmpfs won't)
+	try:
+		return os.open(path, flags | os.O_DIRECT)
+	except OSError:
+		return os.open(path, flags)
+
+libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+libc.pread.restype = ctypes.c_ssize_t
+libc.pread.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int64]
+
+def preadInto(fd, view, offset): #One pread straight into a writable buffer, so O_DIRECT gets the aligned buffer we made.  os.preadv does this, but it's 3.7+.
+	if hasattr(os, 'preadv'):
+		return os.preadv(fd, [view], offset)
+	target = (ctypes.c_char * len(view)).from_buffer(view)
+	got = libc.pread(fd, ctypes.addressof(target), len(view), offset)
+	if got < 0:
+		error = ctypes.get_errno()
+		raise OSError(error, os.strerror(error))
+	return got
+
+def readInto(fd, view, offset): #pread until view is full or we hit the end of the device.  Returns how many bytes were read.
+	done = 0
+	while done < len(view):
+		got = preadInto(fd, view[done:], offset + done)
+		if not got:
+			break
+		done += got
+	return done
@@ -2,12 +2,27 @@
 
 #Modules
 import npyscreen
-import operator
 import os
+import glob
 import curses
 import warnings
+import threading
+import time
+import json
+import socket
 from pySMART import *
 from megacli import *
+from megabatch import *
+from intake import *
+from profiles import *
+from patternwipe import patternWiper, zeroFiller, wipeVerifyError, schedules as wipeSchedules
+from perftest import benchmark
+from diskio import sharingLink
+from metawipe import metadataWiper
+from thermal import thermalGovernor
+from sgio import readTemperature, temperatureAttributes, passthroughError
+from lazysmart import lazyDevice, lazyDeviceList, lazySASattributes, sasErrorLog
+from collector import stationReporter
 from subprocess import Popen, PIPE
 
 #Constants
@@ -15,24 +30,50 @@ from subprocess import Popen, PIPE
 
 #General Constants
 baseSNs = ['000dfa4406d996272000d8481ec0110b', 'S21TNXAGA08036M', 'S21TNXAH201539J'] 	#serials of /dev/sda and permanent drives
-mc = MegaCLI() 																																				#MegaCLI entry point
+mc = batchMegaCLI() 																																		#MegaCLI entry point
 toasters = 4																																					#Number of slots on the toaster
-
-#Test profile constants
-#entries in a given profile should be in the form of {attribute:['value/raw','operator',acceptable range]} such that
-#the profile can be read "the device is good if attribute's (value/raw) is (operator) (acceptable range)
-#e.g. "for SSDs, the device is good if attribute 177's value is greater than or equal to 19"
-#note that SAS profiles are different, as they use megacli instead of pysmart, so there is no 'raw' or 'value'
-profiles = {}
-profiles['SSD'] = {177:['value', operator.ge, 19], 199:['raw',operator.lt, 1]}
-profiles['SATA'] = {1:['raw', operator.lt, 1], 9:['raw', operator.le, 20000], 187:['raw', operator.lt, 1], 198:['raw', operator.lt, 1], 199:['raw', operator.lt, 1], 200:['raw', operator.lt, 1]}
-profiles['SATAEnterprise'] = {1:['raw', operator.lt, 1], 9:['raw', operator.le, 30000], 187:['raw', operator.lt, 1], 198:['raw', operator.lt, 1], 199:['raw', operator.lt, 1], 200:['raw', operator.lt, 1]}
-profiles['SAS'] = {'media_error_count':[None, operator.lt, 1], 'predictive_failure_count': [None, operator.lt, 1], 'drive_has_flagged_a_smart_alert':[None, operator.eq, False], 'uncorrectable_read_errors':[None, operator.lt, 1], 'uncorrectable_write_errors':[None, operator.lt, 1], 'uncorrectable_verify_errors':[None, operator.lt, 1]} 
+mcLock = threading.Lock()																																#MegaCLI doesn't like being run twice at once - hold this around mc calls made from worker threads
+smartLogDir = '/var/log/hddstation/smart'																								#every graded drive's SMART data gets appended here (one .jsonl per day) for regrade.py.  Empty string turns it off.
+smartLogLock = threading.Lock()
+lazySMART = True																																				#only ask smartctl for the pages grading actually reads (see lazysmart.py).  False goes back to pySMART's full query.
+passthroughSMART = True																																	#read SMART attributes and SAS error counters in-process over SG_IO/megaraid pass-through (see sgio.py), falling back to smartctl
+perfResults = {}																																				#benchmark results by serial - kept across rescans, since benchmarking takes a while
+
+#Test profile constants live in profiles.py
+
+#Collector constants - see collector.py
+collectorAddress = ''																#'unix:/run/hddstation/collector.sock' or 'tcp:host:port' to push verdicts, wipes and stage timings to a fleet collector.  Empty string turns it off.
+stationName = socket.gethostname()										#what this station is called in the collector's answers
+collectorSpool = '/var/spool/hddstation/collector.jsonl'	#where pushes wait while the collector is down
+reporter = stationReporter(collectorAddress, stationName, spool = collectorSpool) if collectorAddress else None
+
+#Intake pipeline constants
+#'Identify' always runs first; the stages listed here run after it, in order.  Take 'Verify' out to skip verification.
+#'Benchmark' only runs on toaster drives that passed 'Grade' on SMART (a SMART failure is getting zeroed anyway, and every
+#benchmark holds the toaster link to itself), then re-grades them with perfProfiles - so keep it after 'Grade'.
+intakeStages = ['Grade', 'Benchmark', 'Wipe', 'Verify']
+intakeWipePolicy = {'PASS':'quick', 'WARN':'quick', 'FAIL':'zero'}	#which wipe each grade gets: 'quick', 'zero', 'pattern' (toaster only), or None to leave it alone.  Failed drives leave the building, so they get zeroed.
+intakeStageLimits = {}																#{stage: max drives in that stage at once}, e.g. {'Wipe': 2} if the toaster's USB link is saturating.  Benchmarks already get the link to themselves.
+intakeClearForeign = False														#clearing a foreign config hits EVERY drive on the adapter, so the pipeline won't do it unless told to
+intakePollInterval = 5																#seconds between looks for newly inserted drives
+intakeBenchmarkWrites = False													#also benchmark writes.  This trashes the benchmark zones, so only turn it on if every grade gets wiped anyway.
+
+#Pattern wipe constants
+patternWipeSchedule = 'DoD 3-pass'										#which schedule in patternwipe.py 'Pattern wipe' runs - the contract decides this one
+patternWipeVerify = 'last'														#verify 'last' pass, 'all' passes, or 'none'
+zeroReadFirst = True																	#'Zero disk' on the toaster reads each chunk first and only writes the ones that aren't zero already.  Saves SSD endurance and runs at read speed on empty drives.
+
+#Thermal governor constants - see thermal.py
+thermalCeiling = 50																		#C.  Long toaster jobs are slowed down to keep drives under this (most are rated to 55-60C).  None still shows temperatures but never slows anything.
+thermalHysteresis = 3																	#C under the ceiling a drive has to cool to before its job speeds back up
+thermalSampleInterval = 30														#seconds between temperature reads during long jobs
+thermalCoolTimeout = 5 * thermalSampleInterval								#seconds a frontplane zero waits for a hot drive to cool before starting anyway
+governor = thermalGovernor(thermalCeiling, thermalHysteresis, thermalSampleInterval)
 
 #Menu/Grid header constants (includes inverted)
-gMenuHeaders = {0:"Rescan", 1:"View disk results", 2: "Delete RAIDs", 3:"Quickwipe", 4:"Quickwipe all", 5:"Zero disk", 6:"Exit"}
-gColumnHeaders = {0:"Drive", 1:"Profile", 2:"Serial", 3:"Size", 4:"Pass?"}
-gColumnHeadersIndices = {"Drive":0, "Profile":1, "Serial":2, "Size":3, "Pass?":4}
+gMenuHeaders = {0:"Rescan", 1:"View disk results", 2: "Delete RAIDs", 3:"Quickwipe", 4:"Quickwipe all", 5:"Zero disk", 6:"Pattern wipe", 7:"Benchmark", 8:"Auto intake", 9:"Exit"}
+gColumnHeaders = {0:"Drive", 1:"Profile", 2:"Serial", 3:"Size", 4:"Pass?", 5:"Stage", 6:"Temp"}
+gColumnHeadersIndices = {"Drive":0, "Profile":1, "Serial":2, "Size":3, "Pass?":4, "Stage":5, "Temp":6}
 
 
 #Notes
@@ -72,6 +113,543 @@ def bytes_2_human_readable(number_of_bytes):
     return str(number_of_bytes) + ' ' + unit
 
 
+#Function to work out which profile a pySMART device gets tested against.  Returns None for SAS drives behind the
+#controller, because smartctl and megacli don't play together well - those get rebuilt from megacli by buildSASDevice.
+def deviceProfile(device):
+	if device.is_ssd:
+		return "SSD"
+	elif 'scsi' in device.interface.casefold():
+		return "RAID"
+	elif 'sat' in device.interface.casefold():
+		return "SATA"
+	elif 'megaraid' in device.interface.casefold():
+		return None
+	else:
+		return ""
+
+#Functions to get SMART devices from whichever backend lazySMART picks
+def smartDevice(name, interface=None):
+	if lazySMART:
+		return lazyDevice(name, interface, passthroughSMART)
+	return Device(name, interface)
+
+def smartDeviceList():
+	if lazySMART:
+		return lazyDeviceList(passthroughSMART)
+	return DeviceList()
+
+#Function to build a device out of a MegaCLI physical drive entry for SAS drives, since they don't have SMART attributes.
+def buildSASDevice(pd):
+	#create and populate empty device
+	device = smartDevice(None)
+	device.serial = pd['inquiry_data'].replace('seagate ', '')
+	device.UIName = 'Frontplane Slot ' + str(pd['slot_number'])
+	device.profile = 'SAS'
+	device.capacity = bytes_2_human_readable(pd['raw_size'])
+	device.name = 'bus/0'
+	device.devID = pd['device_id']
+
+	#Migrate MegaCLI test params to 'device'
+	device.SASattributes = dict()
+	device.warn = False
+	device.SASattributes['media_error_count'] = pd['media_error_count']
+	device.SASattributes['predictive_failure_count'] = pd['predictive_failure_count']
+	device.SASattributes['drive_has_flagged_a_smart_alert'] = pd['drive_has_flagged_a_smart_alert']
+
+
+	#PAUSE: since SAS doesn't support SMART attributes, we need to check the drive's error log and plug output in to pdlist before testing.
+	#Lazily, the error log is only read if grading gets past the megacli params above.
+	if lazySMART:
+		device.SASattributes = lazySASattributes(device, pd['device_id'], device.SASattributes, passthrough = passthroughSMART)
+	else:
+		counters, warn = sasErrorLog(pd['device_id'], passthroughSMART)
+		device.SASattributes.update(counters)
+		device.warn = warn
+
+	return device
+
+#Function to check a device's SMART attributes against one profile.  Stops at the first failure.
+def checkSMARTProfile(device, profile):
+	for attribute in profile:
+		if device.attributes[attribute]: #skip if there's no attribute here
+			acceptableParams = profile[attribute]
+			if 'int' in type(acceptableParams[2]).__name__:
+				if not acceptableParams[1](int(getattr(device.attributes[attribute], acceptableParams[0])), acceptableParams[2]): #tests if the attribute is within acceptable parameters
+					return False
+			else:
+				if not acceptableParams[1](getattr(device.attributes[attribute], acceptableParams[0]), acceptableParams[2]): #tests if the attribute is within acceptable parameters
+					return False
+	return True
+
+#Function to test a device for the parameters outlined at the top of this script.
+#Returns 'PASS', 'FAIL' or 'WARN', 'N/A' for RAID drives, or None if the device has no profile.
+def gradeDevice(device):
+
+	#Profile 1: SSD
+	if 'SSD' in device.profile:
+		group = 'SSD'
+		testPassed = checkSMARTProfile(device, profiles['SSD'])
+
+	#Profile 2: SATA plain
+	elif 'SATA' in device.profile and int(device.attributes[9].raw) < sataEnterpriseHours:
+		group = 'SATA'
+		testPassed = checkSMARTProfile(device, profiles['SATA'])
+
+	#Profile 3: SATA enterprise
+	elif 'SATA' in device.profile:
+		group = 'SATAEnterprise'
+		testPassed = checkSMARTProfile(device, profiles['SATAEnterprise'])
+
+	#Profile 4: SAS - this is unfortunately different than the others, because SAS doesn't do smart attributes so we have to use megacli directly.
+	elif 'SAS' in device.profile:
+		group = 'SAS'
+		testPassed = True
+		for attribute in profiles['SAS']:
+			acceptableParams = profiles['SAS'][attribute]
+			if not acceptableParams[1](device.SASattributes[attribute], acceptableParams[2]):
+				testPassed = False
+				break
+
+	#Profile 5: RAID - nothing to test
+	elif 'RAID' in device.profile:
+		return 'N/A'
+
+	#No profile specified
+	else:
+		return None
+
+	#Performance rules, if the drive has been benchmarked.  Metrics we didn't measure are skipped, like missing attributes.
+	results = perfResults.get(device.serial)
+	if testPassed and results:
+		for metric, acceptableParams in perfProfiles.get(group, {}).items():
+			if metric in results and not acceptableParams[1](results[metric], acceptableParams[2]):
+				testPassed = False
+				break
+
+	if not testPassed:
+		return 'FAIL'
+	elif device.warn:
+		return 'WARN'
+	else:
+		return 'PASS'
+
+#Function to read a drive's temperature in C, or None if it won't tell us.  SATA drives report it in attribute 194 (or 190),
+#SAS drives in the temperature log page.  cached=True makes do with the attribute table grading already read.
+def driveTemperature(device, cached=False):
+	try:
+		if 'RAID' in device.profile:
+			return None
+		if 'SAS' in device.profile:
+			return readTemperature('megaraid,' + str(device.devID)) if passthroughSMART else None
+
+		if not cached:
+			if passthroughSMART:
+				target = '/dev/' + device.name
+				if 'megaraid,' in device.interface:
+					target = 'megaraid,' + device.interface.split('megaraid,')[1]
+				try:
+					return readTemperature(target, ata = True)
+				except (OSError, passthroughError):
+					pass #ask smartctl instead
+			device = smartDevice(device.name, device.interface) #a fresh look - the old one's attribute table is as old as the scan
+
+		for num in temperatureAttributes:
+			if device.attributes[num]:
+				return int(str(device.attributes[num].raw).split()[0])
+	except Exception:
+		pass #a temperature is never worth failing a scan or a wipe over
+	return None
+
+#Function to turn a temperature into a grid cell
+def temperatureCell(temperature):
+	return ' ' if temperature is None else str(temperature) + 'C'
+
+#Function to describe a running job's temperature and throttling, for progress lines
+def thermalStatus(throttle):
+	if not throttle or throttle.temperature is None:
+		return ''
+	if throttle.rate:
+		return ', ' + str(throttle.temperature) + 'C (slowed to ' + bytes_2_human_readable(throttle.rate) + '/s)'
+	return ', ' + str(throttle.temperature) + 'C'
+
+#Function to append a graded device's SMART data to today's capture file, so regrade.py can re-grade it later without the drive.
+#Every attribute the drive reports is kept, not just the ones in profiles, so new rules can be checked against old drives.
+def recordSMART(device, verdict):
+	if not smartLogDir or verdict not in ['PASS', 'FAIL', 'WARN']:
+		return
+
+	#grading stops at the first failed rule, so a lazy SAS drive may never have had its error log read.  Read it now, or
+	#regrade.py would take the missing counters as 'not present' and pass the drive if the rule that failed is ever loosened.
+	if 'SAS' in device.profile:
+		for key in lazySASattributes.logKeys:
+			device.SASattributes[key]
+
+	snapshot = {'time': time.time(), 'serial': device.serial, 'profile': device.profile, 'verdict': verdict, 'warn': device.warn}
+	if 'SAS' in device.profile:
+		snapshot['sas'] = device.SASattributes
+	else:
+		snapshot['attributes'] = {}
+		for attribute in device.attributes:
+			if attribute:
+				snapshot['attributes'][attribute.num] = [attribute.value, attribute.raw]
+	if device.serial in perfResults:
+		snapshot['perf'] = {metric: value for metric, value in perfResults[device.serial].items() if not isinstance(value, dict)}
+
+	#never let the capture get in the way of grading
+	try:
+		with smartLogLock:
+			os.makedirs(smartLogDir, exist_ok=True)
+			with open(os.path.join(smartLogDir, time.strftime('%Y-%m-%d') + '.jsonl'), 'a') as log:
+				log.write(json.dumps(snapshot) + '\n')
+	except (OSError, TypeError, ValueError):
+		pass
+
+
+#Function to push a record to the collector, if there is one.  Never blocks - the reporter batches in the background.
+def reportEvent(kind, **fields):
+	if reporter:
+		reporter.push(kind, **fields)
+
+#Function to push a drive's verdict - once per drive, unless the verdict changes.  testDrive runs on every rescan and after
+#every wipe, and the collector counts verdicts as drives processed, so repeats would make rescans look like throughput.
+reportedVerdicts = {}
+reportedVerdictsLock = threading.Lock()
+def reportVerdict(device, verdict, slot):
+	if verdict not in ['PASS', 'FAIL', 'WARN']:
+		return
+	with reportedVerdictsLock:
+		if reportedVerdicts.get(device.serial) == verdict:
+			return
+		reportedVerdicts[device.serial] = verdict
+	reportEvent('verdict', serial = device.serial, profile = device.profile, verdict = verdict, slot = slot)
+
+#Function to push how long each of an intake job's stages took.  intakePipeline calls this when a job finishes.
+def reportIntake(job):
+	serial = job.device.serial if job.device else None
+	for stage, seconds in job.stageTimes.items():
+		reportEvent('timing', serial = serial, slot = job.slot, stage = stage, seconds = round(seconds, 2))
+
+
+#Wipe helpers - these don't touch the UI, so the intake pipeline can run them from worker threads.  They raise on failure.
+#Function to run a command with no output, raising if it fails.  dd filling a whole disk 'fails' with ENOSPC, so okErrors lets callers allow that.
+def runQuiet(command, okErrors=()):
+	cmd = Popen(command, stdout=PIPE, stderr=PIPE)
+	err = cmd.communicate()[1].decode("utf-8", "replace")
+	if cmd.returncode and not any(okError in err for okError in okErrors):
+		raise RuntimeError(command[0] + ' failed: ' + err.strip())
+
+#Toaster wipes share the 'toaster' link with benchmarks (see diskio.py), so a benchmark never runs while a neighbour is mid-chunk.
+#Function to quickwipe a toaster drive (name is /dev/sdX): zero and verify every partition table, RAID/LVM superblock and
+#filesystem signature at both ends of the disk and of every partition (see metawipe.py).  It's a few MB, so it holds the link for all of it.
+def toasterQuickWipe(name):
+	with sharingLink('toaster'):
+		metadataWiper(name).run()
+
+#Function to zero a toaster drive end to end.  Takes for freakin' ever.
+#With zeroReadFirst, progress is called as progress(bytesScanned, bytesWritten, size), throttle (see thermal.py) paces it, and (scanned, written) is returned.
+#Without it, dd can't pause between chunks, so a toaster benchmark waits for the whole zero.
+def toasterZero(name, progress=None, throttle=None):
+	runQuiet(["wipefs", "-a", name])
+	if zeroReadFirst:
+		return zeroFiller(name, progress = progress, throttle = throttle, link = 'toaster').run()
+	with sharingLink('toaster'):
+		runQuiet(["dd", "if=/dev/zero", "of=" + name, "bs=1M", "oflag=direct"], okErrors=["No space left on device"])
+
+#Function to run a multi-pass pattern wipe (see patternwipe.py) over a toaster drive.  Returns the random seed, which is all
+#anybody needs to re-verify the random passes later.  progress and throttle are passed through to patternWiper.
+def toasterPatternWipe(name, scheduleName=None, progress=None, throttle=None):
+	runQuiet(["wipefs", "-a", name])
+	wiper = patternWiper(name, wipeSchedules[scheduleName or patternWipeSchedule], verify = patternWipeVerify, progress = progress, throttle = throttle, link = 'toaster')
+	return wiper.run()
+
+#Function to wipe a frontplane drive by wrapping it in a dummy RAID0, initializing it and deleting the LD again.
+#full=True does a full (zeroing) init instead of a fast init.
+def frontplaneWipe(pd, full=False, clearForeign=False):
+	drive = str(pd['enclosure_id']) + ':' + str(pd['slot_number'])
+	adapter = pd['adapter_id']
+
+	#device already in a RAID?
+	if 'drive_position' in pd.keys():
+		raise RuntimeError('drive is still in a RAID')
+
+	#Device set to bad?  Try to set it good, and find out at create_ld time if that didn't work.
+	if ((pd['firmware_state'] != 'online, spun up') and (pd['firmware_state'] != 'unconfigured(good), spun up')):
+		try:
+			with mcLock:
+				mc.make_pd_good(drive, adapter)
+		except:
+			pass
+
+	#MegaCLI can only clear EVERY foreign state on the adapter at once, so only do it if we've been told it's okay.
+	if pd['foreign_state']:
+		if not clearForeign:
+			raise RuntimeError('drive has a foreign config and clearing foreign configs is turned off')
+		with mcLock:
+			mc.clear_foreign(adapter)
+
+	with mcLock:
+		result = mc.create_ld(0, [drive], adapter, force = True)
+	vd = int(result[1].split('vd ', 1)[1])
+
+	#init the dummy VD, and always try to get rid of it afterwards
+	try:
+		with mcLock:
+			mc.start_init(vd, adapter, full = full)
+		while True:
+			time.sleep(5)
+			with mcLock:
+				result = mc.check_init(vd, adapter)
+			if 'not in progress' in result[1]:
+				break
+	finally:
+		with mcLock:
+			mc.remove_ld(vd, adapter, force=True)
+
+#Function to wipe a whole set of frontplane drives the same way as frontplaneWipe, but with as few MegaCLI calls as possible:
+#one make-good, one create pass, one init start, one progress check per poll and one delete per adapter.
+#allPds is the full mc.physicaldrives() list the pds came from.  Returns {pd inquiry_data: error} for drives that didn't make it.
+def frontplaneWipeAll(pds, allPds, full=False, clearForeign=False):
+	failures = {}
+	adapters = {}
+	for pd in pds:
+		if 'drive_position' in pd.keys():
+			failures[pd['inquiry_data']] = 'drive is still in a RAID'
+		elif pd['foreign_state'] and not clearForeign:
+			failures[pd['inquiry_data']] = 'drive has a foreign config and clearing foreign configs is turned off'
+		else:
+			adapters.setdefault(pd['adapter_id'], []).append(pd)
+
+	for adapter, adapterPds in adapters.items():
+		slots = {}
+		bad = []
+		for pd in adapterPds:
+			drive = str(pd['enclosure_id']) + ':' + str(pd['slot_number'])
+			slots[drive] = pd['inquiry_data']
+			if pd['firmware_state'] not in ['online, spun up', 'unconfigured(good), spun up']:
+				bad.append(drive)
+		serials = dict(slots)
+
+		#anything set to bad gets set good in one go - if it doesn't take, create will tell us
+		if bad:
+			try:
+				with mcLock:
+					mc.make_pds_good(bad, adapter)
+			except:
+				pass
+
+		if any(pd['foreign_state'] for pd in adapterPds):
+			try:
+				with mcLock:
+					mc.clear_foreign(adapter)
+			except Exception as error:
+				for serial in slots.values():
+					failures[serial] = 'clearing the foreign config failed: ' + str(error)
+				continue
+
+		#CfgEachDskRaid0 grabs every unconfigured(good) drive on the adapter, so only use it when that's exactly the drives we were given.
+		#Otherwise fall back to one create per drive.
+		bystanders = [pd for pd in allPds if pd['adapter_id'] == adapter and pd['inquiry_data'] not in slots.values() and 'drive_position' not in pd.keys() and pd['firmware_state'].startswith('unconfigured(good)')]
+		with mcLock:
+			if not bystanders:
+				try:
+					mc.create_each_raid0(adapter)
+				except:
+					pass #some drives may still have made it - ld_slots will say which
+			else:
+				for drive in slots:
+					try:
+						mc.create_ld(0, [drive], adapter, force = True)
+					except:
+						pass
+			#ld_slots is the only way to find the dummy VDs again (to init them or delete them), so give it a second go
+			ldSlots = None
+			for attempt in range(2):
+				try:
+					ldSlots = mc.ld_slots(adapter)
+					break
+				except Exception as error:
+					listError = str(error)
+		if ldSlots is None: #we can't tell which dummy VDs got made, so we can't init them or safely delete them - leave them for a human
+			for serial in slots.values():
+				failures[serial] = "couldn't list VDs after creating dummy VDs (check for leftover RAID0s): " + listError
+			continue
+
+		#find the dummy VD each drive ended up in
+		vds = []
+		for vd, members in ldSlots.items():
+			if len(members) == 1 and members[0] in slots:
+				vds.append(vd)
+				del slots[members[0]]
+		for drive, serial in slots.items():
+			failures[serial] = "couldn't create a dummy VD to wipe"
+		if not vds:
+			continue
+
+		#init them all, wait for all of them, and always try to get rid of them afterwards
+		try:
+			with mcLock:
+				mc.start_inits(vds, adapter, full = full)
+			while True:
+				time.sleep(5)
+				with mcLock:
+					progress = mc.check_inits(adapter)
+				if not any(progress.get(vd, False) for vd in vds):
+					break
+		except Exception as error:
+			for vd in vds:
+				failures[serials[ldSlots[vd][0]]] = 'init failed: ' + str(error)
+		finally:
+			try:
+				with mcLock:
+					mc.remove_lds(vds, adapter, force=True)
+			except Exception as error:
+				for vd in vds:
+					serial = serials[ldSlots[vd][0]]
+					failures[serial] = (failures[serial] + ', and ' if serial in failures else '') + "couldn't delete dummy VD " + str(vd) + ': ' + str(error)
+
+	return failures
+
+
+#Intake pipeline stages - see intake.py.  Each one takes an intakeJob.
+#Function to tell one toaster drive from the next.  A drive swapped in quickly usually gets the freed /dev/sdX back, so the
+#node alone can't tell them apart - the drive's /dev/disk/by-id name (made by udev in the same pass as our toaster link) can.
+#Falls back to the kernel's wwid, then to the node, for bridges that don't hand over a serial.
+def toasterIdentity(name):
+	for link in sorted(glob.glob('/dev/disk/by-id/*')):
+		if '-part' not in link and os.path.realpath(link) == name:
+			return os.path.basename(link)
+	try:
+		with open('/sys/block/' + os.path.basename(name) + '/device/wwid') as wwid:
+			return wwid.read().strip()
+	except OSError:
+		return name
+
+#Function to list everything the intake pipeline should look at, as (slot, key, info) tuples.
+#Protected drives and anything in a RAID (including the OS) are never listed.
+def intakeDetect():
+	present = []
+
+	#toaster slots come and go with their udev symlinks.  The symlink may point at a partition, so trim it to the disk.
+	for toasterNum in range(1,toasters+1):
+		link = '/dev/toaster' + str(toasterNum)
+		if os.path.exists(link):
+			name = os.path.realpath(link).rstrip('0123456789')
+			present.append(('Toaster Slot ' + str(toasterNum), name + ' ' + toasterIdentity(name), name))
+
+	with mcLock:
+		pds = mc.physicaldrives()
+	for pd in pds:
+		if any(serial.casefold() in pd['inquiry_data'] for serial in baseSNs):
+			continue
+		if 'drive_position' in pd.keys():
+			continue
+		present.append(('Frontplane Slot ' + str(pd['slot_number']), pd['inquiry_data'], pd))
+
+	return present
+
+def intakeIdentify(job): #builds the job's device, the same way scanDevices would
+	if job.slot.startswith('Toaster'):
+		device = smartDevice(job.info)
+		device.profile = deviceProfile(device) or ""
+		device.warn = False
+	elif 'sas' in job.info['pd_type']:
+		device = buildSASDevice(job.info)
+	else:
+		device = smartDevice('/dev/bus/0', 'sat+megaraid,' + str(job.info['device_id']))
+		device.profile = deviceProfile(device) or ""
+		device.warn = False
+
+	device.UIName = job.slot
+	if not device.serial:
+		device.serial = "N/A"
+	if device.serial in baseSNs:
+		raise intakeSkip('protected drive')
+	job.device = device
+
+def intakeBenchmarkWanted(job): #toaster drives that passed on SMART, if there's a Benchmark stage - the controller hides frontplane drives from us, so they're graded on SMART alone
+	return 'Benchmark' in intakeStages and job.slot.startswith('Toaster') and job.verdict in ['PASS', 'WARN']
+
+def intakeRecord(job): #captures and reports a job's final verdict
+	job.device.temperature = driveTemperature(job.device, cached = True)
+	recordSMART(job.device, job.verdict)
+	reportVerdict(job.device, job.verdict, job.slot)
+
+def intakeGrade(job):
+	verdict = gradeDevice(job.device)
+	if verdict is None:
+		raise intakeSkip('no profile')
+	job.verdict = verdict
+	if verdict == 'N/A':
+		intakeRecord(job)
+		raise intakeSkip('RAID drive')
+	if not intakeBenchmarkWanted(job):
+		intakeRecord(job) #otherwise the verdict isn't final until the benchmark's in
+
+def intakeBenchmark(job): #benchmarks drives that passed on SMART, then grades them again with the results
+	if not intakeBenchmarkWanted(job):
+		return
+	try:
+		perfResults[job.device.serial] = benchmark(job.info, link = 'toaster', writes = intakeBenchmarkWrites)
+		job.verdict = gradeDevice(job.device)
+	finally:
+		intakeRecord(job)
+
+def intakeWipe(job):
+	method = intakeWipePolicy.get(job.verdict)
+	if not method:
+		raise intakeSkip('no wipe for ' + job.verdict)
+	job.stage = 'Wipe (' + method + ')'
+
+	started = time.monotonic()
+	try:
+		with governor.watch(job.slot, lambda: driveTemperature(job.device)) as throttle:
+			if job.slot.startswith('Toaster'):
+				if method == 'zero':
+					toasterZero(job.info, throttle = throttle)
+				elif method == 'pattern':
+					toasterPatternWipe(job.info, throttle = throttle)
+				else:
+					toasterQuickWipe(job.info)
+			elif method == 'pattern':
+				raise RuntimeError("pattern wipes can't reach drives behind the controller")
+			else:
+				#the controller's init can't be paced, so a hot drive waits to cool down before it starts one
+				if method == 'zero' and not throttle.waitUntilCool(0):
+					job.stage = 'Wipe (' + method + ', cooling)'
+					if throttle.waitUntilCool(thermalCoolTimeout):
+						job.stage = 'Wipe (' + method + ')'
+					else:
+						job.stage = 'Wipe (' + method + ', still hot)' #the drive's own protection will have to do
+				frontplaneWipe(job.info, full = (method == 'zero'), clearForeign = intakeClearForeign)
+	except Exception:
+		reportEvent('wipe', serial = job.device.serial, method = method, ok = False, seconds = round(time.monotonic() - started, 2))
+		raise
+	reportEvent('wipe', serial = job.device.serial, method = method, ok = True, seconds = round(time.monotonic() - started, 2))
+
+def intakeVerify(job):
+	#toaster: every metadata region should be nothing but zeros now.  Pattern wipes end on whatever their last pass wrote, and verify themselves.
+	if job.slot.startswith('Toaster'):
+		if intakeWipePolicy.get(job.verdict) != 'pattern':
+			with sharingLink('toaster'):
+				metadataWiper(job.info).verify()
+
+	#frontplane: the drive should be back to unconfigured(good), out of any RAID
+	else:
+		with mcLock:
+			pds = mc.physicaldrives()
+		for pd in pds:
+			if pd['inquiry_data'] == job.key:
+				if 'drive_position' in pd.keys() or pd['firmware_state'] != 'unconfigured(good), spun up':
+					raise RuntimeError('drive did not come back as unconfigured(good)')
+				return
+		raise RuntimeError('drive disappeared from megacli')
+
+#Function to assemble the stage list for the intake pipeline from intakeStages
+def intakeStageList():
+	stageFunctions = {'Benchmark':intakeBenchmark, 'Grade':intakeGrade, 'Wipe':intakeWipe, 'Verify':intakeVerify}
+	return [('Identify', intakeIdentify)] + [(stage, stageFunctions[stage]) for stage in intakeStages]
+
+
 #npyscreen class wrappers
 class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 	def __init__(self, *args, **kwargs):
@@ -81,6 +659,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 		self.columnHeaders = gColumnHeaders
 		self.columnHeadersIndices = gColumnHeadersIndices
 		self.devlist = []
+		self.intake = None #intake pipeline, when auto intake has been turned on
 		self.scanAndTest() #populate drive list and scan all drives
 
 		#Add enter handlers
@@ -99,7 +678,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 		self.info = self.parent.infoDisplay
 	
 	def scanDevices(hideHidden=True): #Returns a device list of editable devices
-		fullDevList = DeviceList()
+		fullDevList = smartDeviceList()
 
 		#remove /dev/sda and the permanent SSDs
 		if hideHidden:
@@ -137,16 +716,9 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 			#Get device profiles and add to devlist
 			#Also delete SAS drives because smartctl and megacli don't play together well
-			if device.is_ssd:
-				device.profile = "SSD"
-			elif 'scsi' in device.interface.casefold():
-				device.profile = "RAID"
-			elif 'sat' in device.interface.casefold():
-				device.profile = "SATA"
-			elif 'megaraid' in device.interface.casefold(): #SAS drives - delete them and remake them
+			device.profile = deviceProfile(device)
+			if device.profile is None: #SAS drives - delete them and remake them
 				del fullDevList.devices[index]
-			else:
-				device.profile = ""
 
 		#since MegaCLI and smartctl don't play together well and sometimes give different serial numbers, we now need to scan all SAS drives.
 		for index, pd in reversed(list(enumerate(pds))):
@@ -161,57 +733,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			if not 'sas' in pd['pd_type']:
 				continue
 
-			#create and populate empty device
-			device = Device(None)
-			device.serial = pd['inquiry_data'].replace('seagate ', '')
-			device.UIName = 'Frontplane Slot ' + str(pd['slot_number'])
-			device.profile = 'SAS'
-			device.capacity = bytes_2_human_readable(pd['raw_size'])
-			device.name = 'bus/0'
-			device.devID = pd['device_id']
-
-			#Migrate MegaCLI test params to 'device'
-			device.SASattributes = dict()
-			device.warn = False
-			device.SASattributes['media_error_count'] = pd['media_error_count']
-			device.SASattributes['predictive_failure_count'] = pd['predictive_failure_count']
-			device.SASattributes['drive_has_flagged_a_smart_alert'] = pd['drive_has_flagged_a_smart_alert']
-
-
-			#PAUSE: since SAS doesn't support SMART attributes, we need to check the drive's error log and plug output in to pdlist before testing.  Get ready for some weird stuff.
-			cmd = Popen(["smartctl", "-l", "error", "-d", "megaraid," + str(pd['device_id']), "/dev/sda"], stdout=PIPE)
-			errLog = cmd.communicate()[0].decode("utf-8").split('\n')
-			cmd.wait()
-
-			#if error log is shorter than 11 lines, the log should be deformed.  I hope.  Set a warning, but pass the test
-			if len(errLog) < 11:
-				device.SASattributes['uncorrectable_read_errors'] = -1
-				device.SASattributes['uncorrectable_write_errors'] = -1
-				device.SASattributes['uncorrectable_verify_errors'] = -1
-				device.warn = True
-
-			#if error log is the right size but we can't find read/write/verify,
-			else:
-
-				if errLog[8].find('read:') == -1:
-					device.SASattributes['uncorrectable_read_errors'] = -1
-					device.warn = True
-				else:
-					device.SASattributes['uncorrectable_read_errors'] = int(errLog[8].split()[7])
-
-				if errLog[9].find('write:') == -1:
-					device.SASattributes['uncorrectable_write_errors'] = -1
-					device.warn = True
-				else:
-					device.SASattributes['uncorrectable_write_errors'] = int(errLog[9].split()[7])
-
-				if errLog[10].find('verify:') == -1:
-					device.SASattributes['uncorrectable_verify_errors'] = -1
-					device.warn = True
-				else:
-					device.SASattributes['uncorrectable_verify_errors'] = int(errLog[10].split()[7])
-
-			fullDevList.devices.append(device)
+			fullDevList.devices.append(buildSASDevice(pd))
 
 		return fullDevList
 
@@ -226,12 +748,17 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			row.append(dev.serial)
 			row.append(dev.capacity)
 			row.append(' ')
+			row.append(' ')
+			row.append(' ')
 			self.values.append(row)
 
 		#sort
 		self.values.sort(key=lambda x: x[0])
 
 		#create and prepend headers (done AFTER sorting to keep from sorting them in... I don't like it either)
+		self.prependHeaders()
+
+	def prependHeaders(self): #Puts the column headers (and a spacer) on top of the grid
 		row = []
 		for headerIndex in range(len(self.columnHeaders)):
 			row.append(self.columnHeaders[headerIndex])
@@ -254,80 +781,26 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			return #handle this error at some point, for now just quit
 
 		#Handle test profiles
-		testPassed = True
-		testWarn = False
-
-		#Profile 1: SSD
-		if 'SSD' in device.profile:
-			for attribute in profiles['SSD']:
-				if device.attributes[attribute]: #skip if there's no attribute here
-					acceptableParams = profiles['SSD'][attribute]
-					if 'int' in type(acceptableParams[2]).__name__:
-						if not acceptableParams[1](int(getattr(device.attributes[attribute], acceptableParams[0])), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-					else:
-						if not acceptableParams[1](getattr(device.attributes[attribute], acceptableParams[0]), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-
-		#Profile 2: SATA plain... I don't like doing it this way, as it's effectively hardcoding in enterprise hours
-		elif 'SATA' in device.profile and int(device.attributes[9].raw) < 20000:
-			for attribute in profiles['SATA']:
-				if device.attributes[attribute]: #skip if there's no attribute here
-					acceptableParams = profiles['SATA'][attribute]
-					if 'int' in type(acceptableParams[2]).__name__:
-						if not acceptableParams[1](int(getattr(device.attributes[attribute], acceptableParams[0])), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-					else:
-						if not acceptableParams[1](getattr(device.attributes[attribute], acceptableParams[0]), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-
-		#Profile 3: SATA enterprise
-		elif 'SATA' in device.profile:
-			for attribute in profiles['SATAEnterprise']:
-				if device.attributes[attribute]: #skip if there's no attribute here
-					acceptableParams = profiles['SATAEnterprise'][attribute]
-					if 'int' in type(acceptableParams[2]).__name__:
-						if not acceptableParams[1](int(getattr(device.attributes[attribute], acceptableParams[0])), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-					else:
-						if not acceptableParams[1](getattr(device.attributes[attribute], acceptableParams[0]), acceptableParams[2]): #tests if the attribute is within acceptable parameters
-							testPassed = False
-							break
-
-		#Profile 4: SAS - this is unfortunately different than the others, because SAS doesn't do smart attributes so we have to use megacli directly.
-		elif 'SAS' in device.profile:
-
-			for attribute in profiles['SAS']:
-				acceptableParams = profiles['SAS'][attribute]
-				if not acceptableParams[1](device.SASattributes[attribute], acceptableParams[2]):
-					testPassed = False
-					break
-
-		#Profile 5: RAID - print N/A and return.
-		elif 'RAID' in device.profile:
-			self.values[driveRow][self.columnHeadersIndices['Pass?']] = 'N/A'
-			return
+		result = gradeDevice(device)
 
 		#No profile specified: return - handle error here ate some other point
-		else:
+		if result is None:
 			return
 
-
-
 		#test is complete, put results in deviceOverview
-		if not testPassed:
-			self.values[driveRow][self.columnHeadersIndices['Pass?']] = 'FAIL'
-		elif device.warn:
-			self.values[driveRow][self.columnHeadersIndices['Pass?']] = 'WARN'
-		else:
-			self.values[driveRow][self.columnHeadersIndices['Pass?']] = 'PASS'
+		self.values[driveRow][self.columnHeadersIndices['Pass?']] = result
+		device.temperature = driveTemperature(device, cached = True)
+		self.values[driveRow][self.columnHeadersIndices['Temp']] = temperatureCell(device.temperature)
+		recordSMART(device, result)
+		reportVerdict(device, result, device.UIName)
 
 	def scanAndTest(self): #Function to scan for drive changes, update the UI, and test all drives.
+		#don't take the grid back while intake workers still own drives - they'd keep wiping with nothing showing them
+		if self.intake and self.intake.busy():
+			message = str(self.intake.busy()) + " drive(s) still finishing in auto intake.  Wait for them to stop, then rescan."
+			npyscreen.notify_confirm(message, title="Busy!", editw = 1)
+			return
+		self.intake = None #a manual scan takes the grid back from the intake pipeline
 		self.values = []
 		self.values.append(['Scanning... Please wait!'])
 		self.parent.display()
@@ -396,6 +869,17 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 		else:
 			info.append(['No profile selected - uncertain of test parameters.'])
 
+		#Benchmark results, if there are any
+		if device.serial in perfResults:
+			info.append([' '])
+			for metric, value in perfResults[device.serial].items():
+				if isinstance(value, dict): #the histogram
+					for bucket, count in value.items():
+						if count:
+							info.append([' ', 'latency ' + bucket + ' ms', count])
+				else:
+					info.append([' ', metric, value])
+
 
 		self.info.showInfo(info)
 
@@ -410,7 +894,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 		#Are you sure you want to continue?
 		if not suppressMessages:
-			message = "You are about to quickwipe " + self.values[rowNum][self.columnHeadersIndices['Drive']] +'.\n\nThis will dump its partition table or, in the case of a device on the frontplane, it will fast-re-init the drive.  It is much faster than zeroing a disk and results in fewer writes, but it is NOT data-destructive.\n\nWould you like to continue?'
+			message = "You are about to quickwipe " + self.values[rowNum][self.columnHeadersIndices['Drive']] +'.\n\nThis will wipe its partition tables, RAID/LVM superblocks and filesystem signatures or, in the case of a device on the frontplane, it will fast-re-init the drive.  It is much faster than zeroing a disk and results in fewer writes, but it is NOT data-destructive.\n\nWould you like to continue?'
 			confirm = npyscreen.notify_yes_no(message, title="Quickwipe?", editw = 1)
 
 			if not confirm:
@@ -532,6 +1016,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 				return UIName
 
 			#If we made it to this point, we've succeeded.
+			reportEvent('wipe', serial = device.serial, method = 'quick')
 			if not suppressMessages:
 				message = "Drive successfully wiped!"
 				npyscreen.notify_confirm(message, title="Success!", editw = 1)
@@ -547,8 +1032,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 				self.values.append(['Wiping ' + UIName])
 				self.update()
 				self.parent.display()
-				os.system("wipefs -a " + name + " &>/dev/null")
-				os.system("dd if=/dev/zero of=" + name + " bs=512 count=50 &>/dev/null")
+				toasterQuickWipe(name)
 			except:
 				self.values = backupValues
 				self.update()
@@ -560,6 +1044,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 			#replace values in case we're being looped
 			self.values = backupValues
+			reportEvent('wipe', serial = device.serial, method = 'quick')
 
 			if not suppressMessages:
 				message = "Drive successfully wiped!"
@@ -578,7 +1063,48 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 		#Init error watcher
 		errors = []
+
+		#Frontplane drives all get wiped together, so the controller work is a handful of MegaCLI calls instead of a handful per drive
+		try:
+			pds = mc.physicaldrives()
+		except Exception as error:
+			npyscreen.notify_confirm("Couldn't list the frontplane drives: " + str(error), title="Error", editw = 1)
+			return
+		frontplanePds = []
+		frontplaneRows = []
+		for num in range(2, len(self.values)):
+			serial = self.values[num][self.columnHeadersIndices['Serial']]
+			if 'RAID' in self.values[num][self.columnHeadersIndices['Profile']]:
+				continue
+			for device in self.devlist.devices:
+				if device.serial.casefold() in serial.casefold() and 'bus' in device.name.casefold():
+					for pd in pds:
+						if serial.casefold() in pd['inquiry_data']:
+							frontplanePds.append(pd)
+							frontplaneRows.append(num)
+							break
+					break
+
+		if frontplanePds:
+			backupValues = self.values
+			self.values = []
+			self.values.append(['Wiping ' + str(len(frontplanePds)) + ' frontplane drives'])
+			self.update()
+			self.parent.display()
+			try:
+				failures = frontplaneWipeAll(frontplanePds, pds, clearForeign=True)
+			except Exception as error: #anything frontplaneWipeAll didn't catch still shouldn't take the UI down
+				failures = {pd['inquiry_data']: str(error) for pd in frontplanePds}
+			self.values = backupValues
+			for num, pd in zip(frontplaneRows, frontplanePds):
+				if pd['inquiry_data'] in failures:
+					errors.append(self.values[num][self.columnHeadersIndices['Drive']])
+				else:
+					reportEvent('wipe', serial = self.values[num][self.columnHeadersIndices['Serial']], method = 'quick')
+
 		for num in range(len(self.values)):
+			if num in frontplaneRows:
+				continue
 			errors.append(self.quickWipeDisk(rowNum = num, suppressMessages = True))
 
 		#Start building any error message
@@ -622,14 +1148,19 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 		#if we're going for it, assemble information
 		lds = mc.logicaldrives()
+		doomed = {}
 		for ld in lds:
 			if ld['id'] == 0: #if the user is trying to poke ld0, ignore it.  Keep that ld.  it's important.
 				continue
 			else:
-				try:
-					mc.remove_ld(ld['id'], ld['adapter_id'], force=True)
-				except:
-					npyscreen.notify_confirm("Something went wrong in MegaCLI when destroying ld " + ld['id'], title="Something failed", editw = 1)
+				doomed.setdefault(ld['adapter_id'], []).append(ld['id'])
+
+		#one delete per adapter instead of one per ld
+		for adapter, ids in doomed.items():
+			try:
+				mc.remove_lds(ids, adapter, force=True)
+			except:
+				npyscreen.notify_confirm("Something went wrong in MegaCLI when destroying lds " + ', '.join(str(id) for id in ids), title="Something failed", editw = 1)
 
 		npyscreen.notify_confirm("RAID drives destroyed!", title="Success!", editw = 1)
 		self.scanAndTest()
@@ -739,6 +1270,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			self.values = backupValues
 
 			#If we made it to this point, we've succeeded.
+			reportEvent('wipe', serial = device.serial, method = 'zero')
 			message = "Drive successfully zeroed!"
 			npyscreen.notify_confirm(message, title="Success!", editw = 1)
 			self.scanAndTest()
@@ -747,13 +1279,27 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 		#Otherwise, we're not in the frontplane, we're on the toaster - name should be sda/sdb/sdc etc
 		else:
 			name = '/dev/' + name
+
+			#with zeroReadFirst we know how far along we are, so show it - at most once a second
+			lastDraw = [0]
+			throttle = None
+			def progress(scanned, written, size):
+				if time.monotonic() - lastDraw[0] < 1 and scanned < size:
+					return
+				lastDraw[0] = time.monotonic()
+				self.values = []
+				self.values.append(['Zeroing ' + UIName + ': scanned ' + str(int(100 * scanned / size)) + '% (' + bytes_2_human_readable(scanned) + '), wrote ' + bytes_2_human_readable(written) + thermalStatus(throttle)])
+				self.update()
+				self.parent.display()
+
 			try:
 				self.values = []
 				self.values.append(['Zeroing ' + UIName])
 				self.update()
 				self.parent.display()
-				os.system("wipefs -a " + name + " &>/dev/null")
-				os.system("dd if=/dev/zero of=" + name + " bs=512 &>/dev/null")
+				started = time.monotonic()
+				with governor.watch(UIName, lambda: driveTemperature(device)) as throttle:
+					toasterZero(name, progress = progress, throttle = throttle)
 			except:
 				self.values = backupValues
 				self.update()
@@ -764,6 +1310,7 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 
 			#replace values and proclaim our victory
 			self.values = backupValues
+			reportEvent('wipe', serial = device.serial, method = 'zero', seconds = round(time.monotonic() - started, 2))
 			message = "Drive successfully wiped!"
 			npyscreen.notify_confirm(message, title="Success!", editw = 1)
 
@@ -771,7 +1318,161 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			self.update()
 			self.parent.display()
 
-	def custom_print_cell(self, actual_cell, cell_display_value): #Sets colors of the 'pass/fail' column
+	def toggleIntake(self): #Turns the automatic intake pipeline on or off
+		if self.intake and self.intake.running():
+			self.intake.stop()
+			finishing = self.intake.busy()
+			if finishing:
+				message = "Auto intake stopped.  " + str(finishing) + " drive(s) still finishing - each will finish the stage it's in, then stop.  The menu stays locked until they're done; then rescan to go back to the normal view."
+			else:
+				message = "Auto intake stopped.  Rescan to go back to the normal view."
+			npyscreen.notify_confirm(message, title="Auto intake", editw = 1)
+			return
+
+		#stopped, but workers are still mid-stage - a new pipeline would start a second job on the same drives
+		if self.intake and self.intake.busy():
+			message = "Auto intake is stopping - " + str(self.intake.busy()) + " drive(s) still finishing.  Wait for them before starting it again."
+			npyscreen.notify_confirm(message, title="Busy!", editw = 1)
+			return
+
+		policy = ''
+		for verdict in ['PASS', 'WARN', 'FAIL']:
+			policy += verdict + ': ' + str(intakeWipePolicy.get(verdict) or 'no wipe') + '\n'
+		message = "Every drive plugged into the toaster or frontplane (except protected drives and anything in a RAID) will be run through:\n\n" + ' -> '.join(name for name, function in intakeStageList()) + "\n\nand wiped according to its grade:\n" + policy + "\nThis is data-destructive and needs no further confirmation.  Continue?"
+		confirm = npyscreen.notify_yes_no(message, title="Auto intake?", editw = 1)
+		if not confirm:
+			return
+
+		self.intake = intakePipeline(intakeDetect, intakeStageList(), intakeStageLimits, intakePollInterval, finished = reportIntake)
+		self.intake.start()
+		self.showIntake()
+
+	def showIntake(self): #Redraws the grid from the intake pipeline.  Called from the form every time it's idle.
+		if not self.intake:
+			return
+
+		self.values = []
+		devices = []
+		for job in self.intake.snapshot():
+			row = [job.slot, ' ', ' ', ' ', job.verdict, job.stage, temperatureCell(governor.temperature(job.slot))]
+			if job.device:
+				row[self.columnHeadersIndices['Profile']] = job.device.profile
+				row[self.columnHeadersIndices['Serial']] = job.device.serial
+				row[self.columnHeadersIndices['Size']] = job.device.capacity
+				if governor.temperature(job.slot) is None:
+					row[self.columnHeadersIndices['Temp']] = temperatureCell(getattr(job.device, 'temperature', None))
+				devices.append(job.device)
+			self.values.append(row)
+
+		#keep viewDisk working on drives the pipeline found
+		if self.devlist:
+			self.devlist.devices = devices
+
+		self.prependHeaders()
+		self.update()
+
+	def patternWipeDisk(self): #this function runs a multi-pass pattern wipe on a toaster disk, verifying as configured up top
+		rowNum = self.diskSelect()
+
+		#if the user selected a non-disk label
+		if rowNum < 2:
+			return
+
+		UIName = self.values[rowNum][self.columnHeadersIndices['Drive']]
+		serial = self.values[rowNum][self.columnHeadersIndices['Serial']]
+		profile = self.values[rowNum][self.columnHeadersIndices['Profile']]
+		device = False
+		for device in self.devlist.devices:
+			if device.serial.casefold() in serial.casefold():
+				break
+		if not device:
+			info = ['Could not find disk in devlist, consider rescanning first.']
+			self.info.showInfo(info)
+			return UIName
+
+		#pattern wipes write the block device directly, so they only work on the toaster
+		if 'RAID' in profile or 'bus' in device.name.casefold():
+			message = "Pattern wipes only work on toaster drives - the controller hides frontplane drives from us.  Use 'Zero disk' for frontplane drives."
+			npyscreen.notify_confirm(message, title="Failure!", editw = 1)
+			return UIName
+
+		#test resolve
+		schedule = wipeSchedules[patternWipeSchedule]
+		message = "You are about to run a " + patternWipeSchedule + " wipe (" + str(len(schedule)) + " passes, verify " + patternWipeVerify + ") on " + UIName + ".\n\nIt is data-destructive and takes a LONG time per pass, during which this system will be unresponsive.\n\nWould you like to continue?"
+		confirm = npyscreen.notify_yes_no(message, title="Pattern wipe?", editw = 1)
+		if not confirm:
+			return
+
+		#Show progress in place of the grid, at most once a second
+		backupValues = self.values
+		lastDraw = [0]
+		throttle = None
+		def progress(passNumber, passCount, done, size, verifying):
+			if time.monotonic() - lastDraw[0] < 1 and done < size:
+				return
+			lastDraw[0] = time.monotonic()
+			self.values = []
+			self.values.append([('Verifying ' if verifying else 'Wiping ') + UIName + ': pass ' + str(passNumber + 1) + '/' + str(passCount) + ', ' + str(int(100 * done / size)) + '%' + thermalStatus(throttle)])
+			self.update()
+			self.parent.display()
+
+		try:
+			started = time.monotonic()
+			with governor.watch(UIName, lambda: driveTemperature(device)) as throttle:
+				seed = toasterPatternWipe('/dev/' + device.name, progress = progress, throttle = throttle)
+		except wipeVerifyError as error:
+			self.values = backupValues
+			self.update()
+			self.parent.display()
+			npyscreen.notify_confirm("The wipe ran, but " + str(error) + ".  Do not release this drive.", title="Failure!", editw = 1)
+			return UIName
+		except:
+			self.values = backupValues
+			self.update()
+			self.parent.display()
+			npyscreen.notify_confirm("Failed to pattern wipe drive.", title="Failure!", editw = 1)
+			return UIName
+
+		#replace values and proclaim our victory
+		self.values = backupValues
+		reportEvent('wipe', serial = device.serial, method = 'pattern', seconds = round(time.monotonic() - started, 2))
+		message = "Drive successfully pattern wiped" + (" and verified" if patternWipeVerify != 'none' else "") + "!\n\nRandom seed (for re-verifying later): " + str(seed)
+		npyscreen.notify_confirm(message, title="Success!", editw = 1)
+
+		#update because npyscreens might not.
+		self.update()
+		self.parent.display()
+
+	def benchmarkDisks(self): #this function benchmarks every toaster drive (one at a time - they share a USB link) and re-grades them
+		message = "This will benchmark every drive on the toaster (reads only) and re-grade them against the performance profiles.  It takes about a minute per drive, during which this system will be unresponsive.\n\nWould you like to continue?"
+		confirm = npyscreen.notify_yes_no(message, title="Benchmark?", editw = 1)
+		if not confirm:
+			return
+
+		backupValues = self.values
+		toasterDrives = [device for device in self.devlist.devices if device.UIName.startswith('Toaster')]
+		errors = []
+		for number, device in enumerate(toasterDrives):
+			self.values = []
+			self.values.append(['Benchmarking ' + device.UIName + ' (' + str(number + 1) + '/' + str(len(toasterDrives)) + ')'])
+			self.update()
+			self.parent.display()
+			try:
+				perfResults[device.serial] = benchmark('/dev/' + device.name, link = 'toaster')
+			except:
+				errors.append(device.UIName)
+
+		#re-grade with the new numbers
+		self.values = backupValues
+		for device in self.devlist.devices:
+			self.testDrive(device)
+		self.update()
+		self.parent.display()
+
+		if errors:
+			npyscreen.notify_confirm("Couldn't benchmark:\n" + '\n'.join(errors), title="Failure!", editw = 1)
+
+	def custom_print_cell(self, actual_cell, cell_display_value): #Sets colors of the 'pass/fail', 'stage' and 'temp' columns
 		if cell_display_value == "FAIL":
 			actual_cell.color = "DANGER"
 		elif cell_display_value == "PASS":
@@ -780,6 +1481,17 @@ class overviewWidget(npyscreen.SimpleGrid): #widget for the drive overview
 			actual_cell.color = "WARNING"
 		elif cell_display_value == "WARN":
 			actual_cell.color = "WARNING"
+		elif cell_display_value == "Done":
+			actual_cell.color = "GOOD"
+		elif str(cell_display_value).startswith("Error in"):
+			actual_cell.color = "DANGER"
+		elif str(cell_display_value).endswith("C") and str(cell_display_value)[:-1].isdigit() and thermalCeiling:
+			if int(str(cell_display_value)[:-1]) >= thermalCeiling:
+				actual_cell.color = "DANGER"
+			elif int(str(cell_display_value)[:-1]) >= thermalCeiling - thermalHysteresis:
+				actual_cell.color = "WARNING"
+			else:
+				actual_cell.color = "DEFAULT"
 		else:
 			actual_cell.color = "DEFAULT"
 
@@ -818,6 +1530,16 @@ class menuWidget(npyscreen.SimpleGrid): #widget for the main (horizontal) menu.
 		cell_x = self.edit_cell[1]
 		selection = self.menuHeaders[cell_x]
 
+		#the intake pipeline owns the drives while it's running, and until its last worker is done after it's stopped - only let the user look, turn it off, or leave
+		intake = self.overview.intake
+		if intake and selection not in ['View disk results', 'Auto intake', 'Exit']:
+			if intake.running():
+				npyscreen.notify_confirm("Auto intake is running.  Turn it off before doing anything by hand.", title="Busy!", editw = 1)
+				return
+			if intake.busy():
+				npyscreen.notify_confirm("Auto intake is stopping - " + str(intake.busy()) + " drive(s) still finishing.  Wait for them before doing anything by hand.", title="Busy!", editw = 1)
+				return
+
 		if 'Rescan' in selection:
 			self.overview.scanAndTest()
 
@@ -840,6 +1562,15 @@ class menuWidget(npyscreen.SimpleGrid): #widget for the main (horizontal) menu.
 		elif 'Zero disk' in selection:
 			self.overview.fullWipeDisk()
 
+		elif 'Pattern wipe' in selection:
+			self.overview.patternWipeDisk()
+
+		elif 'Benchmark' in selection:
+			self.overview.benchmarkDisks()
+
+		elif 'Auto intake' in selection:
+			self.overview.toggleIntake()
+
 
 class infoWidget(npyscreen.SimpleGrid):
 	def __init__(self, *args, **kwargs):
@@ -879,8 +1610,9 @@ class mainForm(npyscreen.FormBaseNew): #Main form for organizing widgets
 		#create the drive overview grid
 		#note that if max_height is too HIGH, driveoverview won't show at all.  If you're running this on a machine other than the one
 		#I tested on, this might be a problem.  woo npycurses, eff dynamic height determination.
+		#column_width x 7 columns has to fit the console (the old 5 x 26 did), or Stage and Temp end up off to the right
 		self.nextrely = 2
-		self.driveOverview = self.add(overviewWidget, column_width=26, name="Drive Overview", editable=False, select_whole_line=True, max_height=19)
+		self.driveOverview = self.add(overviewWidget, column_width=18, name="Drive Overview", editable=False, select_whole_line=True, max_height=19)
 
 		#Add a menu
 		#I've looked all over... I don't see a way to dynamically set these values, so they may look like crap
@@ -889,8 +1621,18 @@ class mainForm(npyscreen.FormBaseNew): #Main form for organizing widgets
 		self.nextrelx += 5
 		self.menu = self.add(menuWidget, column_width=19, name="Main Menu", editable=True)
 
+		#wake up every second or so while waiting for keys, so the intake pipeline can redraw the grid
+		self.keypress_timeout = 10
+
+	def while_waiting(self): #Called by npyscreen whenever it's been waiting for a key for keypress_timeout
+		if self.driveOverview.intake:
+			self.driveOverview.showIntake()
+			self.display()
+
 	def afterEditing(self): #Kills program once this form is done being edited
 		self.parentApp.setNextForm(None)
+		if reporter:
+			reporter.stop() #push (or spool) whatever's still queued
 
 
 
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+
+#Modules
+import threading
+import time
+
+#Intake pipeline
+#Watches the toaster and the frontplane for drives showing up and pushes each one through a list of stages
+#(by default grade -> wipe -> verify) without anybody pressing buttons.  Every drive gets its own worker thread, so
+#one drive can be wiping while the next one is still being graded.  Stages that shouldn't have too many drives in them at
+#once can be given a limit in stageLimits.
+#This module doesn't know anything about SMART or MegaCLI - drivetest.py hands it the detect function and the stage functions.
+
+
+class intakeJob(): #One drive's trip through the pipeline
+	def __init__(self, slot, key, info):
+		self.slot = slot					#UI name of the slot, e.g. 'Toaster Slot 1'
+		self.key = key						#whatever detect() uses to tell one drive from the next in the same slot
+		self.info = info					#whatever detect() handed us about the drive (device path, megacli pd, ...)
+		self.device = None					#filled in by a stage once the drive has been identified
+		self.stage = 'Queued'
+		self.verdict = ' '
+		self.error = None
+		self.done = False
+		self.stageTimes = {}				#seconds spent in each stage, for the curious
+
+
+class intakeSkip(Exception): #Raise this from a stage to stop a drive's trip without calling it an error (protected drive, RAID, etc.)
+	pass
+
+
+class intakePipeline():
+	def __init__(self, detect, stages, stageLimits=None, pollInterval=5, finished=None):
+		#detect should return a list of (slot, key, info) tuples, one for every drive that's plugged in right now.
+		#stages is a list of (name, function) tuples.  Each function gets the intakeJob and either returns or raises.
+		#stageLimits is {stageName: max drives in that stage at once}.  Stages not listed are unlimited.
+		#finished, if given, is called with each job once it's done (or skipped, or errored out).
+		self.detect = detect
+		self.stages = stages
+		self.finished = finished
+		self.pollInterval = pollInterval
+		self.jobs = {}
+		self.lock = threading.Lock()
+		self.stopping = threading.Event()
+		self.watcher = None
+
+		self.stageGates = {}
+		for name, limit in (stageLimits or {}).items():
+			self.stageGates[name] = threading.BoundedSemaphore(limit)
+
+	def start(self): #Starts watching for drives
+		if self.running():
+			return
+		self.stopping.clear()
+		self.watcher = threading.Thread(target=self.watch, daemon=True)
+		self.watcher.start()
+
+	def stop(self): #Stops watching.  Drives that are mid-stage finish that stage, then stop.
+		self.stopping.set()
+
+	def running(self): #True while we're watching for new drives
+		return self.watcher is not None and self.watcher.is_alive()
+
+	def busy(self): #Returns how many drives are still mid-trip - stop() doesn't wait for them, so this can be nonzero after running() is False
+		with self.lock:
+			return sum(1 for job in self.jobs.values() if not job.done)
+
+	def watch(self): #Polls detect() and starts a worker for every drive we haven't seen in its slot yet
+		while not self.stopping.is_set():
+			try:
+				present = self.detect()
+			except Exception:
+				present = None #controller hiccup - just try again next poll
+
+			if present is not None:
+				self.reconcile(present)
+
+			self.stopping.wait(self.pollInterval)
+
+	def reconcile(self, present): #Adds jobs for new drives and forgets drives that have been pulled
+		seen = set()
+		with self.lock:
+			for slot, key, info in present:
+				seen.add(slot)
+				job = self.jobs.get(slot)
+
+				#same drive still sitting in the slot - nothing to do
+				if job and job.key == key:
+					continue
+
+				#new drive (or a swap faster than we poll - detect's key has to carry the drive's identity, not just its device node)
+				job = intakeJob(slot, key, info)
+				self.jobs[slot] = job
+				threading.Thread(target=self.run, args=(job,), daemon=True).start()
+
+			#drive pulled: forget it once it's done, so plugging it back in runs it again
+			for slot in list(self.jobs):
+				if slot not in seen and self.jobs[slot].done:
+					del self.jobs[slot]
+
+	def run(self, job): #Walks one job through every stage
+		for name, function in self.stages:
+			if self.stopping.is_set():
+				job.stage = 'Stopped'
+				break
+
+			gate = self.stageGates.get(name)
+			if gate:
+				job.stage = name + ' (waiting)'
+				gate.acquire()
+
+			job.stage = name
+			started = time.monotonic()
+			try:
+				function(job)
+			except intakeSkip as skip:
+				job.stage = 'Skipped: ' + str(skip)
+				break
+			except Exception as error:
+				job.stage = 'Error in ' + name
+				job.error = str(error)
+				break
+			finally:
+				job.stageTimes[name] = time.monotonic() - started
+				if gate:
+					gate.release()
+
+		else:
+			job.stage = 'Done'
+
+		job.done = True
+		if self.finished:
+			try:
+				self.finished(job)
+			except Exception:
+				pass #a broken callback shouldn't take the pipeline down with it
+
+	def snapshot(self): #Returns the current jobs sorted by slot, for the UI to draw
+		with self.lock:
+			return sorted(self.jobs.values(), key=lambda job: job.slot)
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+#Modules
+import re
+from subprocess import Popen, PIPE
+from sgio import readSMARTAttributes, readErrorCounters, passthroughError
+
+#Lazy SMART backend
+#pySMART's DeviceList() runs a full 'smartctl -a' on every drive and parses everything, including the error and self-test
+#logs, which the drive has to go read off its platters.  Grading only ever looks at a handful of attributes and stops at
+#the first failure.  So this only asks smartctl for identity ('-i') up front, and fetches a page ('-A' for the attribute
+#table, '-l error' for the SAS error counters) the first time something actually reads from it.  Fetched pages stay on the
+#device object for the rest of the scan, so viewDisk and recordSMART don't ask again.
+#lazyDevice looks enough like a pySMART Device for everything in drivetest.py.
+#With passthrough=True the attribute table and the SAS error counters are read in-process (see sgio.py) instead of
+#forking smartctl, which is kept as the fallback for anything the pass-through can't reach.
+
+
+#Function to run smartctl and hand back its output lines.  smartctl's exit status is a bitmask of drive complaints, not
+#a success flag, so we don't look at it - a missing page just parses as empty.
+def smartctl(arguments):
+	cmd = Popen(["smartctl"] + arguments, stdout=PIPE)
+	output = cmd.communicate()[0].decode("utf-8", "replace").split('\n')
+	cmd.wait()
+	return output
+
+#Function to get the three uncorrectable error counters for a SAS drive behind the controller, from the error counter
+#log pages (passthrough) or 'smartctl -l error'.  Returns (counters, warn): counters that can't be found are -1, and warn is set if any of them couldn't be.
+def sasErrorLog(deviceID, passthrough=False):
+	if passthrough:
+		try:
+			return readErrorCounters('megaraid,' + str(deviceID))
+		except (OSError, passthroughError):
+			pass #controller or driver won't do it - ask smartctl
+
+	errLog = smartctl(["-l", "error", "-d", "megaraid," + str(deviceID), "/dev/sda"])
+	counters = {}
+	warn = False
+
+	#if error log is shorter than 11 lines, the log should be deformed.  I hope.  Set a warning, but pass the test
+	if len(errLog) < 11:
+		counters['uncorrectable_read_errors'] = -1
+		counters['uncorrectable_write_errors'] = -1
+		counters['uncorrectable_verify_errors'] = -1
+		return counters, True
+
+	#if error log is the right size but we can't find read/write/verify,
+	for line, label, key in [(8, 'read:', 'uncorrectable_read_errors'), (9, 'write:', 'uncorrectable_write_errors'), (10, 'verify:', 'uncorrectable_verify_errors')]:
+		if errLog[line].find(label) == -1:
+			counters[key] = -1
+			warn = True
+		else:
+			counters[key] = int(errLog[line].split()[7])
+
+	return counters, warn
+
+
+class smartAttribute(): #One row of the attribute table, with the same field names pySMART uses
+	def __init__(self, num, name, flags, value, worst, thresh, attrType, updated, whenFailed, raw):
+		self.num = num
+		self.name = name
+		self.flags = flags
+		self.value = value
+		self.worst = worst
+		self.thresh = thresh
+		self.type = attrType
+		self.updated = updated
+		self.when_failed = whenFailed
+		self.raw = raw
+
+
+class lazyDevice():
+	def __init__(self, name, interface=None, passthrough=False):
+		#name is 'sda', '/dev/sda' or 'bus/0'.  None makes an empty device for callers to fill in (SAS drives, see drivetest.buildSASDevice).
+		self.name = name.replace('/dev/', '') if name else None
+		self.interface = interface
+		self.passthrough = passthrough
+		self.serial = None
+		self.model = None
+		self.capacity = None
+		self.is_ssd = False
+		self.pages = {}			#parsed smartctl pages, by page name
+		self.queries = 0		#smartctl runs for this device, for anybody checking that laziness is paying off
+		if self.name:
+			if not self.interface:
+				self.detectInterface()
+			self.identify()
+
+	def run(self, arguments): #Runs smartctl against this device
+		self.queries += 1
+		if self.interface:
+			arguments = arguments + ['-d', self.interface]
+		return smartctl(arguments + ['/dev/' + self.name])
+
+	def detectInterface(self): #Asks smartctl what kind of device this is, the way pySMART does when it isn't told
+		for line in self.run(['-d', 'test']):
+			m = re.search(r"of type '([^']+)'", line)
+			if m:
+				self.interface = m.group(1)
+				return
+		self.interface = ''
+
+	def identify(self): #Reads identity: serial, model, capacity and whether it's an SSD
+		for line in self.run(['-i']):
+			if ':' not in line:
+				continue
+			key, value = [part.strip() for part in line.split(':', 1)]
+			key = key.casefold()
+			if key in ['device model', 'product']:
+				self.model = value
+			elif key == 'serial number':
+				self.serial = value
+			elif key in ['user capacity', 'total nvm capacity']:
+				self.capacity = value.split('[')[-1].rstrip(']') if '[' in value else value
+			elif key == 'rotation rate':
+				self.is_ssd = 'solid state' in value.casefold()
+
+	def passthroughTarget(self): #Where sgio.py should send commands: the device node, or 'megaraid,N' for SATA drives behind the controller (name 'bus/0' has no node)
+		if 'megaraid,' in self.interface:
+			return 'megaraid,' + self.interface.split('megaraid,')[1]
+		return '/dev/' + self.name
+
+	@property
+	def attributes(self): #The attribute table as a 256-long list indexed by attribute ID, like pySMART.  Fetched on first use.
+		if 'attributes' not in self.pages:
+			table = [None] * 256
+			if self.passthrough and ('sat' in self.interface or self.interface == 'ata'):
+				try:
+					for fields in readSMARTAttributes(self.passthroughTarget()):
+						table[int(fields[0])] = smartAttribute(*fields)
+					self.pages['attributes'] = table
+					return table
+				except (OSError, passthroughError):
+					table = [None] * 256 #bridge or drive won't pass it through - ask smartctl
+
+			inTable = False
+			for line in self.run(['-A']):
+				if line.startswith('ID#'):
+					inTable = True
+					continue
+				fields = line.split(None, 9)
+				if not inTable or len(fields) < 10 or not fields[0].isdigit():
+					continue
+				num = int(fields[0])
+				if num < 256:
+					table[num] = smartAttribute(*fields)
+			self.pages['attributes'] = table
+		return self.pages['attributes']
+
+
+class lazySASattributes(dict): #SAS test params: megacli's are filled in up front, the error log counters are fetched on first use
+	logKeys = ['uncorrectable_read_errors', 'uncorrectable_write_errors', 'uncorrectable_verify_errors']
+
+	def __init__(self, device, deviceID, *args, passthrough=False, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.device = device
+		self.deviceID = deviceID
+		self.passthrough = passthrough
+
+	def __missing__(self, key):
+		if key not in self.logKeys:
+			raise KeyError(key)
+		counters, warn = sasErrorLog(self.deviceID, self.passthrough)
+		self.device.queries = getattr(self.device, 'queries', 0) + 1
+		self.update(counters)
+		if warn:
+			self.device.warn = True
+		return counters[key]
+
+
+class lazyDeviceList(): #Stand-in for pySMART's DeviceList: one 'smartctl --scan-open', then a lazyDevice per drive
+	def __init__(self, passthrough=False):
+		self.devices = []
+		for line in smartctl(['--scan-open']):
+			line = line.split('#', 1)[0].split()
+			if len(line) < 3 or line[1] != '-d':
+				continue
+			self.devices.append(lazyDevice(line[0], line[2], passthrough))
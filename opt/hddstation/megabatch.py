@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+#Modules
+import re
+from megacli import *
+
+#Batched MegaCLI operations
+#Every MegaCLI() call forks MegaCli64, and the stock wrapper only does one drive or one LD per call.  MegaCli64 itself is
+#happy to take lists (-L1,2,3, -PhysDrv[32:0,32:1]) and to report on every LD at once (-LALL), so this adds list versions
+#of the calls the wipe paths use.  It's a drop-in replacement for MegaCLI - everything the old object did still works.
+
+class batchMegaCLI(MegaCLI):
+	def remove_lds(self, drives, adapter, force = False): #Deletes several LDs in one call.  drives is a list of LD ids.
+		cmd = []
+		cmd.append("-L{0}".format(','.join(str(drive) for drive in drives)))
+		if force:
+			cmd.append('-Force')
+		cmd.append('-a{0}'.format(adapter))
+		return self.execute("-CfgLdDel {0}".format(' '.join(cmd)))
+
+	def make_pds_good(self, drives, adapter): #Sets several drives to unconfigured(good) in one call.  drives is a list of 'enclosure:slot'
+		return self.execute("-PDMakeGood -PhysDrv [{0}] -a{1}".format(','.join(drives), adapter))
+
+	def create_each_raid0(self, adapter): #Wraps EVERY unconfigured(good) drive on the adapter in its own RAID0, in one call
+		return self.execute("-CfgEachDskRaid0 -a{0}".format(adapter))
+
+	def start_inits(self, drives, adapter, full = False): #Starts initializing several LDs in one call
+		cmd = []
+		cmd.append("-Start")
+		if full:
+			cmd.append('-full')
+		cmd.append("-L{0}".format(','.join(str(drive) for drive in drives)))
+		cmd.append("-a{0}".format(adapter))
+		return self.execute("-LDInit {0}".format(' '.join(cmd)))
+
+	def check_inits(self, adapter): #Returns {LD id: True if an init is still running} for every LD on the adapter, in one call
+		progress = {}
+		for line in self.execute("-LDInit -ShowProg -LALL -a{0}".format(adapter)):
+			m = re.search(r'vd #(\d+)', line)
+			if m:
+				progress[int(m.group(1))] = 'not in progress' not in line
+		return progress
+
+	def ld_slots(self, adapter): #Returns {LD id: ['enclosure:slot', ...]} for every LD on the adapter, in one call
+		slots = {}
+		ld = None
+		enclosure = None
+		for line in self.execute("-LdPdInfo -a{0}".format(adapter)):
+			m = re.match(r'^virtual drive:(\d+)', line)
+			if m:
+				ld = int(m.group(1))
+				slots[ld] = []
+				continue
+
+			m = re.match(r'^enclosure device id:(\d+|n\/a)', line)
+			if m:
+				enclosure = m.group(1) if m.group(1) != 'n/a' else '0'
+				continue
+
+			m = re.match(r'^slot number:(\d+)', line)
+			if m and ld is not None:
+				slots[ld].append(enclosure + ':' + m.group(1))
+		return slots
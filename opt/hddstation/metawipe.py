@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+
+#Modules
+import fcntl
+import glob
+import mmap
+import os
+import struct
+from subprocess import Popen, PIPE
+from diskio import openDirect, readInto
+
+#Metadata-aware quickwipe
+#'wipefs -a' plus zeroing the first 50 sectors left the backup GPT at the end of the disk, md 0.90/1.0 superblocks and fake-RAID
+#anchors (also at the end), LVM metadata past the first 25K, btrfs mirror superblocks, and everything inside the partitions.
+#Plug a drive like that into a new owner's machine and it comes back as the old array.
+#This works out every region that can hold a partition table or a signature - the fixed windows below, plus wherever
+#wipefs (blkid's prober) finds a signature on the disk or on any of its partitions - zeroes them all with a handful of
+#positioned writes, reads them back to check, and tells the kernel to forget the old partitions.  It's a few MB of I/O - well under a
+#second - and leaves nothing that blkid, mdadm, LVM or a GPT recovery tool will recognize.  The data itself is still
+#there, so it's not a replacement for zeroing drives that are leaving the building.
+
+headBytes = 2 * 1024 * 1024			#start of the disk: MBR, primary GPT, LVM label + metadata, md 1.1/1.2, LUKS1 keyslots, ZFS L0/L1, fs superblocks
+tailBytes = 1 * 1024 * 1024			#end of the disk: backup GPT, md 0.90/1.0, ZFS L2/L3, DDF/IMSM/vendor fake-RAID anchors, LVM's second metadata copy
+partitionBytes = 1 * 1024 * 1024	#start and end of every partition, for the same signatures one level down
+btrfsMirrors = [64 * 1024 * 1024, 256 * 1024 * 1024 * 1024]	#btrfs keeps superblock copies here, far from either end
+btrfsMirrorBytes = 64 * 1024
+probeBytes = 64 * 1024						#zeroed from every signature wipefs finds - the magic plus the superblock around it
+alignment = 4096								#every region is rounded out to this, so O_DIRECT is happy on 512e and 4Kn drives
+maxLogicalPartitions = 128			#stop walking an extended partition chain after this many, in case it loops
+
+BLKSSZGET = 0x1268							#ioctl: logical sector size
+BLKRRPART = 0x125F							#ioctl: re-read partition table
+extendedTypes = [0x05, 0x0F, 0x85]
+
+
+class metadataVerifyError(Exception): #Raised when a region reads back as anything but zeros
+	def __init__(self, what, offset):
+		super().__init__(what + ' still has data at byte ' + str(offset) + ' after wiping')
+		self.what = what
+		self.offset = offset
+
+
+class metadataWiper():
+	def __init__(self, path):
+		self.path = path
+		self.size = None
+		self.sectorSize = 512
+
+	def readAt(self, fd, offset, length): #Reads length bytes at offset through an aligned buffer.  Short at the end of the disk.
+		start = offset // alignment * alignment
+		end = min(-(-(offset + length) // alignment) * alignment, self.size)
+		if end <= start:
+			return b''
+		buffer = mmap.mmap(-1, end - start)
+		done = readInto(fd, memoryview(buffer), start)
+		return buffer[offset - start:min(offset - start + length, done)]
+
+	def partitions(self, fd): #Returns [(start, length, label)] in bytes for every partition the MBR or either GPT knows about
+		found = []
+		mbr = self.readAt(fd, 0, 512)
+		if len(mbr) < 512 or mbr[510:512] != b'\x55\xaa':
+			mbr = None
+
+		#GPT: primary header at LBA 1, backup at the last LBA.  Read both - a half-wiped disk might only have one of them.
+		for headerLBA in [1, self.size // self.sectorSize - 1]:
+			header = self.readAt(fd, headerLBA * self.sectorSize, 92)
+			if header[:8] != b'EFI PART':
+				continue
+			entriesLBA, entryCount, entrySize = struct.unpack_from('<QII', header, 72)
+			if not 128 <= entrySize <= 4096 or entryCount > 4096:
+				continue
+			entries = self.readAt(fd, entriesLBA * self.sectorSize, entryCount * entrySize)
+			for index in range(len(entries) // entrySize):
+				entry = entries[index * entrySize:(index + 1) * entrySize]
+				if entry[:16] == bytes(16):
+					continue #unused entry
+				firstLBA, lastLBA = struct.unpack_from('<QQ', entry, 32)
+				found.append((firstLBA * self.sectorSize, (lastLBA - firstLBA + 1) * self.sectorSize, 'GPT partition ' + str(index + 1)))
+
+		#MBR: four primaries, and a chain of EBRs for logical partitions.  Each EBR is a table of its own, so it gets wiped too.
+		if mbr:
+			for index in range(4):
+				partType = mbr[446 + index * 16 + 4]
+				start, count = struct.unpack_from('<II', mbr, 446 + index * 16 + 8)
+				if partType in [0, 0xEE] or not count:
+					continue #empty, or the protective entry in front of a GPT
+				found.append((start * self.sectorSize, count * self.sectorSize, 'MBR partition ' + str(index + 1)))
+				if partType in extendedTypes:
+					found.extend(self.logicalPartitions(fd, start))
+
+		return found
+
+	def logicalPartitions(self, fd, extendedStart): #Walks the EBR chain of an extended partition
+		found = []
+		ebrLBA = extendedStart
+		for number in range(maxLogicalPartitions):
+			found.append((ebrLBA * self.sectorSize, self.sectorSize, 'EBR ' + str(number + 1)))
+			ebr = self.readAt(fd, ebrLBA * self.sectorSize, 512)
+			if len(ebr) < 512 or ebr[510:512] != b'\x55\xaa':
+				break
+			start, count = struct.unpack_from('<II', ebr, 446 + 8)
+			if count:
+				found.append(((ebrLBA + start) * self.sectorSize, count * self.sectorSize, 'logical partition ' + str(number + 5)))
+			nextStart = struct.unpack_from('<I', ebr, 446 + 16 + 8)[0]
+			if not nextStart:
+				break
+			ebrLBA = extendedStart + nextStart
+		return found
+
+	def probeTargets(self): #Returns [(path, byte offset into the disk)] for the disk and every partition the kernel has a node for
+		targets = [(self.path, 0)]
+		name = os.path.basename(os.path.realpath(self.path))
+		for start in sorted(glob.glob('/sys/class/block/' + name + '/' + name + '*/start')):
+			try:
+				with open(start) as sectors:
+					targets.append(('/dev/' + os.path.basename(os.path.dirname(start)), int(sectors.read()) * 512)) #sysfs counts 512-byte sectors whatever the drive's size
+			except (OSError, ValueError):
+				pass
+		return targets
+
+	def probe(self): #Returns [(offset, length, what)] for every signature wipefs can find, anywhere on the disk or in its partitions
+		found = []
+		for path, base in self.probeTargets():
+			try:
+				cmd = Popen(['wipefs', '--no-act', '--parsable', path], stdout=PIPE, stderr=PIPE)
+			except OSError:
+				return found #no wipefs - the fixed windows will have to do
+			for line in cmd.communicate()[0].decode('utf-8', 'replace').split('\n'):
+				fields = line.split(',') #offset,uuid,label,type - labels can have commas in, so type is the last field
+				if line.startswith('#') or len(fields) < 4:
+					continue
+				try:
+					found.append((base + int(fields[0], 16), probeBytes, fields[-1] + ' signature'))
+				except ValueError:
+					pass
+		return found
+
+	def regions(self, fd): #Returns [(offset, length, what)], aligned, clipped to the disk and merged where they overlap
+		wanted = [(0, headBytes, 'start of disk'), (self.size - tailBytes, tailBytes, 'end of disk')]
+		wanted.extend(self.probe())
+		for mirror in btrfsMirrors:
+			wanted.append((mirror, btrfsMirrorBytes, 'btrfs mirror superblock'))
+
+		for start, length, label in self.partitions(fd):
+			if start >= self.size:
+				continue #table points off the end of the disk - nothing to wipe there
+			length = min(length, self.size - start)
+			wanted.append((start, min(partitionBytes, length), 'start of ' + label))
+			wanted.append((start + length - min(partitionBytes, length), min(partitionBytes, length), 'end of ' + label))
+			for mirror in btrfsMirrors:
+				if mirror < length:
+					wanted.append((start + mirror, btrfsMirrorBytes, 'btrfs mirror in ' + label))
+
+		merged = []
+		for offset, length, what in sorted(wanted):
+			if offset >= self.size:
+				continue
+			start = max(0, offset // alignment * alignment)
+			end = min(self.size, -(-(offset + length) // alignment) * alignment)
+			if end <= start:
+				continue
+			if merged and start <= merged[-1][1]:
+				merged[-1][1] = max(merged[-1][1], end)
+				continue
+			merged.append([start, end, what])
+		return [(start, end - start, what) for start, end, what in merged]
+
+	def run(self): #Wipes and verifies every region.  Returns the regions.  Raises on any failure.
+		fd = openDirect(self.path, os.O_RDWR)
+		try:
+			self.size = os.lseek(fd, 0, os.SEEK_END)
+			try:
+				self.sectorSize = struct.unpack('i', fcntl.ioctl(fd, BLKSSZGET, b'\0' * 4))[0]
+			except OSError:
+				self.sectorSize = 512 #not a block device (an image file) - assume 512
+
+			regions = self.regions(fd)
+			zeros = memoryview(mmap.mmap(-1, max(length for offset, length, what in regions))) #page-aligned and already zero
+			for offset, length, what in regions:
+				view = zeros[:length]
+				while len(view):
+					written = os.pwrite(fd, view, offset + (length - len(view)))
+					view = view[written:]
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+		self.verify(regions)
+		self.rereadPartitions()
+		return regions
+
+	def verify(self, regions=None): #Reads regions back (or works them out fresh) and raises metadataVerifyError if any of them isn't zero
+		fd = openDirect(self.path, os.O_RDONLY)
+		try:
+			self.size = os.lseek(fd, 0, os.SEEK_END)
+			if regions is None:
+				regions = self.regions(fd)
+			for offset, length, what in regions:
+				data = self.readAt(fd, offset, length)
+				if len(data) < length:
+					raise metadataVerifyError(what, offset + len(data))
+				if data.count(0) != length:
+					raise metadataVerifyError(what, offset + len(data) - len(data.lstrip(b'\0')))
+		finally:
+			os.close(fd)
+
+	def rereadPartitions(self): #Tells the kernel the partitions are gone.  Busy drives (or image files) just keep their stale view until unplugged.
+		try:
+			fd = os.open(self.path, os.O_RDONLY)
+		except OSError:
+			return
+		try:
+			fcntl.ioctl(fd, BLKRRPART)
+		except OSError:
+			pass
+		finally:
+			os.close(fd)
@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+#Modules
+import mmap
+import os
+import queue
+import random
+import threading
+from diskio import sharingLink, openDirect, readInto
+
+#Pattern wipe engine
+#Some contracts want multi-pass overwrites (pattern, complement, random) with a verify at the end.  dd from /dev/urandom
+#is nowhere near drive speed, so:
+#	- pattern passes fill a few page-aligned buffers once and write the same buffers over and over
+#	- random passes use a seeded stream that's cheap to make and can be made again later for verify.  Each pass gets
+#	  a pool of random bytes from its seed, and each chunk is a slice of the pool at a seeded offset pushed through a
+#	  seeded byte permutation (bytes.translate runs at memory speed).  Every chunk is different, no chunk needs the ones
+#	  before it, and none of it is cryptographic - it doesn't need to be, it just needs to not be the data that was there.
+#	- random chunks are made on a second thread while the previous one is being written
+#Writes and reads use O_DIRECT where the device allows it, so we're measuring the drive and not the page cache.
+#Both classes take an optional throttle (see thermal.py) and call throttle.pace(bytes) after every chunk, and an optional
+#link name (see diskio.py) so a benchmark on the same link gets it to itself between chunks.
+
+#Pass schedules: lists of ('pattern', bytes) or ('random',) passes, run in order
+def complement(pattern): #Returns the bitwise complement of a pattern
+	return bytes(byte ^ 0xFF for byte in pattern)
+
+schedules = {}
+schedules['Zero'] = [('pattern', b'\x00')]
+schedules['Random'] = [('random',)]
+schedules['DoD 3-pass'] = [('pattern', b'\x00'), ('pattern', complement(b'\x00')), ('random',)]
+schedules['Pattern/complement/random'] = [('pattern', b'\x55'), ('pattern', complement(b'\x55')), ('random',)]
+schedules['Schneier 7-pass'] = [('pattern', b'\xff'), ('pattern', b'\x00')] + [('random',)] * 5
+
+chunkSize = 8 * 1024 * 1024		#bytes per write - big enough to keep a spinning drive streaming
+ringSize = 3									#aligned buffers in flight per wipe
+
+
+class wipeVerifyError(Exception): #Raised when a verify pass reads back something other than what we wrote
+	def __init__(self, passNumber, offset):
+		super().__init__('verify of pass ' + str(passNumber) + ' failed at byte ' + str(offset))
+		self.passNumber = passNumber
+		self.offset = offset
+
+
+class randomStream(): #Seeded, regenerable pseudo-random stream, one chunk at a time
+	def __init__(self, seed, passNumber, size=chunkSize):
+		self.seed = seed
+		self.passNumber = passNumber
+		self.size = size
+		self.pool = random.Random(self.chunkSeed(-1)).getrandbits(8 * size * 2).to_bytes(size * 2, 'little') #randbytes() is 3.9+, and the station runs 3.6
+
+	def chunkSeed(self, chunkIndex): #Every (seed, pass, chunk) gets its own seed
+		return (self.seed << 64) ^ (self.passNumber << 40) ^ (chunkIndex & ((1 << 40) - 1))
+
+	def chunk(self, chunkIndex): #Returns chunk chunkIndex of the stream
+		rng = random.Random(self.chunkSeed(chunkIndex))
+		table = list(range(256))
+		rng.shuffle(table)
+		offset = rng.randrange(self.size)
+		return self.pool[offset:offset + self.size].translate(bytes(table))
+
+
+class patternWiper():
+	def __init__(self, path, schedule, seed=None, verify='last', progress=None, throttle=None, link=None):
+		#schedule is a list of passes (see schedules above).  verify is 'last', 'all' or 'none'.
+		#progress, if given, is called as progress(passNumber, passCount, bytesDone, size, verifying) every chunk.
+		#seed is the random stream's seed - keep it (it's in self.seed) if you want to verify random passes later.
+		self.path = path
+		self.schedule = schedule
+		self.seed = seed if seed is not None else int.from_bytes(os.urandom(8), 'little')
+		self.verify = verify
+		self.progress = progress
+		self.throttle = throttle
+		self.link = link
+		self.size = None
+
+	def run(self): #Runs every pass in the schedule, verifying as asked.  Raises on any failure.
+		fd = openDirect(self.path, os.O_WRONLY)
+		try:
+			self.size = os.lseek(fd, 0, os.SEEK_END)
+			for passNumber, spec in enumerate(self.schedule):
+				self.writePass(fd, passNumber, spec)
+				if self.verify == 'all' or (self.verify == 'last' and passNumber == len(self.schedule) - 1):
+					self.verifyPass(passNumber, spec)
+		finally:
+			os.close(fd)
+		return self.seed
+
+	def chunks(self): #Yields (chunkIndex, offset, length) for the whole device
+		for chunkIndex, offset in enumerate(range(0, self.size, chunkSize)):
+			yield chunkIndex, offset, min(chunkSize, self.size - offset)
+
+	def expected(self, passNumber, spec): #Returns a function that gives the bytes a pass wrote into a chunk
+		if spec[0] == 'pattern':
+			block = (spec[1] * (chunkSize // len(spec[1]) + 1))[:chunkSize]
+			return lambda chunkIndex: block
+		stream = randomStream(self.seed, passNumber)
+		return stream.chunk
+
+	def report(self, passNumber, offset, length, verifying): #Called after every chunk: paces the job and reports progress
+		if self.throttle:
+			self.throttle.pace(length)
+		if self.progress:
+			self.progress(passNumber, len(self.schedule), offset + length, self.size, verifying)
+
+	def writePass(self, fd, passNumber, spec):
+		chunkData = self.expected(passNumber, spec)
+		ring = [mmap.mmap(-1, chunkSize) for index in range(ringSize)] #mmap memory is page-aligned, which O_DIRECT needs.  It goes away with the last view of it.
+
+		#pattern passes: fill the ring once and keep writing it
+		if spec[0] == 'pattern':
+			ring[0][:] = chunkData(0)
+			for chunkIndex, offset, length in self.chunks():
+				with sharingLink(self.link):
+					self.writeAll(fd, memoryview(ring[0])[:length], offset)
+				self.report(passNumber, offset, length, False)
+
+		#random passes: a second thread makes chunks while this one writes them
+		else:
+			free = queue.Queue()
+			full = queue.Queue()
+			for buffer in ring:
+				free.put(buffer)
+			stop = threading.Event()
+			failures = []
+
+			def produce():
+				try:
+					for chunkIndex, offset, length in self.chunks():
+						buffer = free.get()
+						if stop.is_set():
+							return
+						buffer[:] = chunkData(chunkIndex)
+						full.put((buffer, offset, length))
+				except Exception as error:
+					failures.append(error)
+				finally:
+					full.put(None)
+
+			producer = threading.Thread(target=produce, daemon=True)
+			producer.start()
+			try:
+				while True:
+					item = full.get()
+					if item is None:
+						break
+					buffer, offset, length = item
+					with sharingLink(self.link):
+						self.writeAll(fd, memoryview(buffer)[:length], offset)
+					free.put(buffer)
+					self.report(passNumber, offset, length, False)
+			finally:
+				stop.set()
+				free.put(ring[0]) #unblock the producer if we're bailing out early
+				producer.join()
+			if failures:
+				raise failures[0]
+
+		os.fsync(fd)
+
+	def writeAll(self, fd, view, offset): #pwrite until the whole view is on the disk
+		while len(view):
+			written = os.pwrite(fd, view, offset)
+			view = view[written:]
+			offset += written
+
+	def verifyPass(self, passNumber, spec): #Reads the device back and checks it against what the pass wrote
+		chunkData = self.expected(passNumber, spec)
+		buffer = mmap.mmap(-1, chunkSize)
+		fd = openDirect(self.path, os.O_RDONLY)
+		try:
+			for chunkIndex, offset, length in self.chunks():
+				with sharingLink(self.link):
+					done = readInto(fd, memoryview(buffer)[:length], offset)
+				if done < length:
+					raise wipeVerifyError(passNumber, offset + done)
+				#compare as bytes - memoryview == memoryview goes item by item, bytes == bytes is one memcmp
+				if buffer[:length] != chunkData(chunkIndex)[:length]:
+					raise wipeVerifyError(passNumber, offset)
+				self.report(passNumber, offset, length, True)
+		finally:
+			os.close(fd)
+
+
+class zeroFiller(): #Zeroes a device, but reads it first and only writes the chunks that aren't zero already
+	#Drives off decommissioned systems are often mostly empty, so this runs at read speed and saves SSDs a full drive write.
+	#progress, if given, is called as progress(bytesScanned, bytesWritten, size) every chunk.
+	def __init__(self, path, progress=None, throttle=None, link=None):
+		self.path = path
+		self.progress = progress
+		self.throttle = throttle
+		self.link = link
+		self.size = None
+		self.scanned = 0
+		self.written = 0
+
+	def run(self): #Returns (bytes scanned, bytes written).  Raises on any failure.
+		zeros = bytes(chunkSize)
+		buffer = mmap.mmap(-1, chunkSize)
+		writeBuffer = mmap.mmap(-1, chunkSize) #fresh anonymous memory is already zero, and nothing ever writes to this one
+		fd = openDirect(self.path, os.O_RDWR)
+		try:
+			self.size = os.lseek(fd, 0, os.SEEK_END)
+			for offset in range(0, self.size, chunkSize):
+				length = min(chunkSize, self.size - offset)
+				moved = length
+				with sharingLink(self.link):
+					done = readInto(fd, memoryview(buffer)[:length], offset)
+					if done < length:
+						raise OSError('short read at byte ' + str(offset + done))
+
+					#slicing an mmap copies it, but the copy and compare are both memcpy/memcmp speed - far quicker than the disk
+					if buffer[:length] != (zeros if length == chunkSize else zeros[:length]):
+						zeroView = memoryview(writeBuffer)[:length]
+						while len(zeroView):
+							written = os.pwrite(fd, zeroView, offset + (length - len(zeroView)))
+							zeroView = zeroView[written:]
+						self.written += length
+						moved += length
+
+				self.scanned += length
+				if self.throttle:
+					self.throttle.pace(moved)
+				if self.progress:
+					self.progress(self.scanned, self.written, self.size)
+
+			if self.written:
+				os.fsync(fd)
+		finally:
+			os.close(fd)
+
+		return self.scanned, self.written
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+#Modules
+import mmap
+import os
+import random
+import threading
+import time
+from diskio import linkLock, openDirect, preadInto
+
+#Drive benchmark
+#Some drives pass every SMART rule and still read at a fraction of their rated speed, or stall for seconds at a time.
+#This measures sequential MB/s at the outer, middle and inner zones of the disk plus random-read IOPS and a latency
+#histogram, so gradeDevice can hold drives to perfProfiles (in profiles.py).
+#Everything is O_DIRECT so we measure the drive and not the page cache.  Reads only, unless writes=True - and writes
+#trash whatever is in the zones, so only ask for them on drives that are about to be wiped anyway.
+#
+#The four toaster slots share one USB link, so benchmarking a toaster drive while anything else on the link is busy
+#measures the link, not the drive.  Pass the same link name for drives that share a link and the benchmark gets the link
+#to itself (see diskio.py).
+
+zoneBytes = 256 * 1024 * 1024		#how much to read (and write) per zone
+sequentialRequest = 1024 * 1024	#bytes per sequential request
+randomRequest = 4096						#bytes per random read
+randomReads = 2000							#random reads per benchmark (split across the queue)
+randomSeconds = 20							#...unless this many seconds pass first
+queueDepth = 4									#random reads in flight at once
+histogramBuckets = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]	#upper edges in ms; anything slower goes in '>5000'
+
+
+#Helper functions
+def percentile(ordered, fraction): #Returns the given fraction's percentile of an already-sorted list
+	if not ordered:
+		return 0
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class driveBenchmark():
+	def __init__(self, path, writes=False, seed=0):
+		self.path = path
+		self.writes = writes
+		self.seed = seed
+		self.size = None
+
+	def run(self): #Runs everything and returns a flat {metric: number} dict (plus 'random_read_histogram')
+		fd = openDirect(self.path, os.O_RDWR if self.writes else os.O_RDONLY)
+		try:
+			self.size = os.lseek(fd, 0, os.SEEK_END)
+			results = {}
+
+			#sequential, per zone.  Zones are clamped so a small drive just gets its whole self read three times.
+			span = min(zoneBytes, self.size) // sequentialRequest * sequentialRequest
+			zones = {'outer': 0, 'middle': (self.size // 2) // sequentialRequest * sequentialRequest, 'inner': (self.size - span) // sequentialRequest * sequentialRequest}
+			for direction in (['read', 'write'] if self.writes else ['read']):
+				speeds = []
+				for zone, start in zones.items():
+					start = min(start, self.size - span)
+					speed = self.sequential(fd, start, span, direction == 'write')
+					results['seq_' + direction + '_' + zone + '_mbps'] = speed
+					speeds.append(speed)
+				results['seq_' + direction + '_min_mbps'] = min(speeds)
+
+			results.update(self.randomRead(fd))
+			return results
+		finally:
+			os.close(fd)
+
+	def sequential(self, fd, start, span, write): #Returns MB/s for one zone
+		buffer = mmap.mmap(-1, sequentialRequest) #page-aligned, which O_DIRECT needs
+		view = memoryview(buffer)
+		started = time.monotonic()
+		for offset in range(start, start + span, sequentialRequest):
+			if write:
+				os.pwrite(fd, view, offset)
+			else:
+				preadInto(fd, view, offset)
+		if write:
+			os.fsync(fd)
+		elapsed = max(time.monotonic() - started, 1e-6)
+		return round(span / elapsed / 1000000, 1)
+
+	def randomRead(self, fd): #Returns IOPS, latency percentiles and a histogram for random reads at queueDepth
+		blocks = self.size // randomRequest
+		latencies = []
+		latenciesLock = threading.Lock()
+		deadline = time.monotonic() + randomSeconds
+
+		def worker(workerNumber):
+			rng = random.Random(self.seed * queueDepth + workerNumber)
+			buffer = mmap.mmap(-1, randomRequest)
+			view = memoryview(buffer)
+			mine = []
+			for read in range(randomReads // queueDepth):
+				if time.monotonic() > deadline:
+					break
+				offset = rng.randrange(blocks) * randomRequest
+				started = time.monotonic()
+				preadInto(fd, view, offset)
+				mine.append((time.monotonic() - started) * 1000)
+			with latenciesLock:
+				latencies.extend(mine)
+
+		started = time.monotonic()
+		workers = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(queueDepth)]
+		for thread in workers:
+			thread.start()
+		for thread in workers:
+			thread.join()
+		elapsed = max(time.monotonic() - started, 1e-6)
+
+		latencies.sort()
+		histogram = {}
+		for edge in histogramBuckets:
+			histogram['<=' + str(edge)] = 0
+		histogram['>' + str(histogramBuckets[-1])] = 0
+		for latency in latencies:
+			for edge in histogramBuckets:
+				if latency <= edge:
+					histogram['<=' + str(edge)] += 1
+					break
+			else:
+				histogram['>' + str(histogramBuckets[-1])] += 1
+
+		results = {}
+		results['random_read_iops'] = round(len(latencies) / elapsed, 1)
+		results['random_read_p50_ms'] = round(percentile(latencies, 0.5), 2)
+		results['random_read_p99_ms'] = round(percentile(latencies, 0.99), 2)
+		results['random_read_max_ms'] = round(latencies[-1], 2) if latencies else 0
+		results['random_read_histogram'] = histogram
+		return results
+
+
+#Function to benchmark a drive, waiting until it has its link to itself if it shares one
+def benchmark(path, link=None, writes=False):
+	if link is None:
+		return driveBenchmark(path, writes = writes).run()
+	with linkLock(link).exclusive():
+		return driveBenchmark(path, writes = writes).run()
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+
+#Modules
+import operator
+
+#Test profile constants - shared by drivetest.py and regrade.py, so keep this file free of anything that needs a controller or a terminal.
+#entries in a given profile should be in the form of {attribute:['value/raw','operator',acceptable range]} such that
+#the profile can be read "the device is good if attribute's (value/raw) is (operator) (acceptable range)
+#e.g. "for SSDs, the device is good if attribute 177's value is greater than or equal to 19"
+#note that SAS profiles are different, as they use megacli instead of pysmart, so there is no 'raw' or 'value'
+profiles = {}
+profiles['SSD'] = {177:['value', operator.ge, 19], 199:['raw',operator.lt, 1]}
+profiles['SATA'] = {1:['raw', operator.lt, 1], 9:['raw', operator.le, 20000], 187:['raw', operator.lt, 1], 198:['raw', operator.lt, 1], 199:['raw', operator.lt, 1], 200:['raw', operator.lt, 1]}
+profiles['SATAEnterprise'] = {1:['raw', operator.lt, 1], 9:['raw', operator.le, 30000], 187:['raw', operator.lt, 1], 198:['raw', operator.lt, 1], 199:['raw', operator.lt, 1], 200:['raw', operator.lt, 1]}
+profiles['SAS'] = {'media_error_count':[None, operator.lt, 1], 'predictive_failure_count': [None, operator.lt, 1], 'drive_has_flagged_a_smart_alert':[None, operator.eq, False], 'uncorrectable_read_errors':[None, operator.lt, 1], 'uncorrectable_write_errors':[None, operator.lt, 1], 'uncorrectable_verify_errors':[None, operator.lt, 1]} 
+
+#SATA drives with fewer power-on hours (attribute 9 raw) than this are graded as 'SATA', the rest as 'SATAEnterprise'.
+#I don't like doing it this way, as it's effectively hardcoding in enterprise hours
+sataEnterpriseHours = 20000
+
+#Performance profile constants - checked by gradeDevice once a drive has been benchmarked (see perftest.py).
+#Same form as the SAS profile: {metric:[None,'operator',acceptable range]}.  Metrics a benchmark didn't measure (writes,
+#usually) are skipped, and drives that haven't been benchmarked at all are graded on SMART alone.
+#e.g. "for plain SATA, the device is good if its slowest zone reads at 40MB/s or better"
+perfProfiles = {}
+perfProfiles['SSD'] = {'seq_read_min_mbps':[None, operator.ge, 100], 'seq_write_min_mbps':[None, operator.ge, 50], 'random_read_p99_ms':[None, operator.le, 100]}
+perfProfiles['SATA'] = {'seq_read_min_mbps':[None, operator.ge, 40], 'seq_write_min_mbps':[None, operator.ge, 30], 'random_read_p99_ms':[None, operator.le, 1000]}
+perfProfiles['SATAEnterprise'] = {'seq_read_min_mbps':[None, operator.ge, 40], 'seq_write_min_mbps':[None, operator.ge, 30], 'random_read_p99_ms':[None, operator.le, 1000]}
@@ -0,0 +1,275 @@
+#!/usr/bin/python3
+
+#Modules
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+import numpy
+from profiles import *
+
+#Offline re-grader
+#When compliance changes a threshold in profiles.py, this answers "which drives we already processed would fail now?"
+#without putting them back in the toaster.  It reads the SMART captures drivetest.py writes (smartLogDir, one .jsonl per day),
+#turns them into one NumPy column per attribute, and grades every snapshot at once with whole-column comparisons.
+#The operators in profiles (operator.lt, operator.ge, ...) work on NumPy arrays as-is, so the profiles don't need to change.
+#
+#Usage:
+#	regrade.py /var/log/hddstation/smart								grade every capture with the current profiles
+#	regrade.py /var/log/hddstation/smart --save fleet.npz			same, and save the columns so next time loads in a blink
+#	regrade.py fleet.npz --old old_profiles.py --csv verdicts.csv	compare against an old copy of profiles.py instead of the recorded verdicts
+#
+#Needs numpy, which the station itself doesn't.
+
+rawNumber = re.compile(r'^\s*(\d+)') #raw values look like '1234' or '34 (Min/Max 20/45)' - only the leading number counts
+
+
+#Helper functions
+#Function to turn a raw/value string into a number for the columns.  Anything we can't read becomes NaN, which grades as 'attribute not present'.
+def toNumber(text):
+	if isinstance(text, bool) or isinstance(text, (int, float)):
+		return float(text)
+	if text is None:
+		return numpy.nan
+	match = rawNumber.match(str(text))
+	if not match:
+		return numpy.nan
+	return float(match.group(1))
+
+#Function to find every capture file under the given paths
+def findSources(paths):
+	sources = []
+	for path in paths:
+		if os.path.isdir(path):
+			sources.extend(sorted(glob.glob(os.path.join(path, '**', '*.jsonl'), recursive=True)))
+			sources.extend(sorted(glob.glob(os.path.join(path, '**', '*.npz'), recursive=True)))
+		else:
+			sources.append(path)
+	return sources
+
+#Function to read .jsonl captures into columns: {'serial', 'profile', 'verdict', 'time', 'warn', 'value_<id>', 'raw_<id>', 'sas_<name>', 'perf_<metric>'}
+def loadCaptures(filenames):
+	serials = []
+	profileNames = []
+	verdicts = []
+	times = []
+	warns = []
+	sparse = {} #column name -> ([row indices], [values]), so each column only costs what it actually holds
+
+	row = 0
+	for filename in filenames:
+		with open(filename) as capture:
+			for line in capture:
+				if not line.strip():
+					continue
+				try:
+					snapshot = json.loads(line)
+				except ValueError:
+					continue #half-written line from a station that lost power - skip it
+
+				serials.append(snapshot.get('serial', 'N/A'))
+				profileNames.append(snapshot.get('profile', ''))
+				verdicts.append(snapshot.get('verdict', ''))
+				times.append(snapshot.get('time', 0))
+				warns.append(bool(snapshot.get('warn', False)))
+
+				for attribute, (value, raw) in snapshot.get('attributes', {}).items():
+					for name, number in (('value_' + str(attribute), value), ('raw_' + str(attribute), raw)):
+						rows, values = sparse.setdefault(name, ([], []))
+						rows.append(row)
+						values.append(toNumber(number))
+
+				for prefix in ['sas', 'perf']:
+					for attribute, number in snapshot.get(prefix, {}).items():
+						rows, values = sparse.setdefault(prefix + '_' + attribute, ([], []))
+						rows.append(row)
+						values.append(toNumber(number))
+
+				row += 1
+
+	columns = {}
+	columns['serial'] = numpy.array(serials, dtype=str)
+	columns['profile'] = numpy.array(profileNames, dtype=str)
+	columns['verdict'] = numpy.array(verdicts, dtype=str)
+	columns['time'] = numpy.array(times, dtype=numpy.float64)
+	columns['warn'] = numpy.array(warns, dtype=bool)
+	for name, (rows, values) in sparse.items():
+		column = numpy.full(row, numpy.nan)
+		column[rows] = values
+		columns[name] = column
+	return columns
+
+#Function to load a store written by saveStore
+def loadStore(filename):
+	with numpy.load(filename) as store:
+		return {name: store[name] for name in store.files}
+
+#Function to save columns as an uncompressed .npz (uncompressed, because loading fast is the whole point)
+def saveStore(columns, filename):
+	numpy.savez(filename, **columns)
+
+#Function to glue several sets of columns together.  Columns missing from one set are NaN for its rows.
+def mergeColumns(columnSets):
+	if len(columnSets) == 1:
+		return columnSets[0]
+
+	merged = {}
+	names = set()
+	for columns in columnSets:
+		names.update(columns)
+	for name in names:
+		parts = []
+		for columns in columnSets:
+			if name in columns:
+				parts.append(columns[name])
+			else:
+				parts.append(numpy.full(len(columns['serial']), numpy.nan))
+		merged[name] = numpy.concatenate(parts)
+	return merged
+
+#Function to load profiles out of some other copy of profiles.py (e.g. last month's, from git)
+def loadProfiles(filename):
+	namespace = {}
+	with open(filename) as source:
+		exec(compile(source.read(), filename, 'exec'), namespace)
+	return namespace['profiles'], namespace.get('sataEnterpriseHours', sataEnterpriseHours), namespace.get('perfProfiles', {})
+
+#Function to get the column a profile rule looks at.  Rules with no 'value'/'raw' read the SAS columns, or prefix's columns if given.
+def ruleColumn(columns, attribute, params, count, prefix='sas'):
+	if params[0] is None:
+		name = prefix + '_' + str(attribute)
+	else:
+		name = params[0] + '_' + str(attribute)
+	if name in columns:
+		return columns[name]
+	return numpy.full(count, numpy.nan) #nobody ever reported this attribute - it's skipped, same as on the station
+
+
+#Function to grade every snapshot in columns at once.  Mirrors drivetest.gradeDevice:
+#attributes a drive doesn't report are skipped, the first failing rule fails the drive, and a warning only shows if nothing failed.
+#Performance rules run after the SMART rules, against whatever benchmark numbers were captured.
+#Returns (verdicts, failedOn) - failedOn names the first rule each failing snapshot broke.
+def gradeColumns(columns, gradeProfiles, enterpriseHours, gradePerfProfiles={}):
+	count = len(columns['serial'])
+	profileNames = columns['profile']
+	verdicts = numpy.full(count, 'N/A', dtype='<U4')
+	failedOn = numpy.full(count, '', dtype=object)
+
+	hours = ruleColumn(columns, 9, ['raw'], count)
+	with numpy.errstate(invalid='ignore'):
+		young = hours < enterpriseHours
+	isSATA = numpy.char.find(profileNames, 'SATA') >= 0
+	groups = {}
+	groups['SSD'] = numpy.char.find(profileNames, 'SSD') >= 0
+	groups['SATA'] = isSATA & young & ~groups['SSD']
+	groups['SATAEnterprise'] = isSATA & ~young & ~groups['SSD']
+	groups['SAS'] = numpy.char.find(profileNames, 'SAS') >= 0
+
+	for group, members in groups.items():
+		rows = numpy.flatnonzero(members)
+		if not len(rows) or group not in gradeProfiles:
+			continue
+
+		failed = numpy.zeros(len(rows), dtype=bool)
+		rules = [(attribute, params, 'sas') for attribute, params in gradeProfiles[group].items()]
+		rules += [(metric, params, 'perf') for metric, params in gradePerfProfiles.get(group, {}).items()]
+		for attribute, params, prefix in rules:
+			if not isinstance(params[2], (bool, int, float)):
+				raise ValueError('Rule ' + group + '/' + str(attribute) + ' compares against ' + repr(params[2]) + ' - only numbers can be re-graded offline')
+
+			column = ruleColumn(columns, attribute, params, count, prefix)[rows]
+			with numpy.errstate(invalid='ignore'):
+				broken = ~numpy.isnan(column) & ~params[1](column, params[2])
+
+			#only the first broken rule counts, like the station's early exit
+			firstBreak = broken & ~failed
+			failedOn[rows[firstBreak]] = group + ':' + str(attribute)
+			failed |= broken
+
+		verdicts[rows] = numpy.where(failed, 'FAIL', numpy.where(columns['warn'][rows], 'WARN', 'PASS'))
+
+	return verdicts, failedOn
+
+#Function to pick the newest snapshot of each serial.  Returns row indices.
+def latestPerDrive(columns):
+	order = numpy.argsort(columns['time'], kind='stable')[::-1]
+	serials, first = numpy.unique(columns['serial'][order], return_index=True)
+	return order[first]
+
+
+#Output
+def writeCSV(filename, columns, rows, before, after, failedOn):
+	with open(filename, 'w') as out:
+		out.write('serial,profile,time,before,after,failed_on\n')
+		for row in rows:
+			out.write(','.join([columns['serial'][row], columns['profile'][row], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(columns['time'][row])), before[row], after[row], failedOn[row]]) + '\n')
+
+def printSummary(columns, rows, before, after, failedOn, elapsed):
+	print('Re-graded ' + str(len(columns['serial'])) + ' snapshots of ' + str(len(rows)) + ' drives in ' + str(round(elapsed, 2)) + 's')
+	print('')
+	print('Verdict    before     after')
+	for verdict in ['PASS', 'WARN', 'FAIL', 'N/A']:
+		print(verdict.ljust(8) + str(int(numpy.sum(before[rows] == verdict))).rjust(8) + str(int(numpy.sum(after[rows] == verdict))).rjust(10))
+
+	changed = rows[before[rows] != after[rows]]
+	print('')
+	print(str(len(changed)) + ' drives changed verdict:')
+	transitions = {}
+	for row in changed:
+		transitions.setdefault((before[row], after[row]), []).append(row)
+	for (old, new), members in sorted(transitions.items()):
+		print('  ' + (old or '?') + ' -> ' + new + ': ' + str(len(members)))
+
+	newlyFailed = [row for row in changed if after[row] == 'FAIL']
+	if newlyFailed:
+		print('')
+		print('Newly failing drives:')
+		for row in newlyFailed:
+			print('  ' + columns['serial'][row].ljust(34) + columns['profile'][row].ljust(10) + failedOn[row])
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Re-grade stored SMART captures against profiles.py')
+	parser.add_argument('sources', nargs='+', help='capture directories, .jsonl captures or .npz stores')
+	parser.add_argument('--old', help='an older profiles.py to compare against (default: the verdicts recorded at scan time)')
+	parser.add_argument('--save', help='save the loaded columns to this .npz store')
+	parser.add_argument('--csv', help='write per-drive verdicts to this file')
+	parser.add_argument('--all-snapshots', action='store_true', help='report every snapshot instead of the newest one per drive')
+	args = parser.parse_args()
+
+	started = time.monotonic()
+	sources = findSources(args.sources)
+	captures = [source for source in sources if source.endswith('.jsonl')]
+	columnSets = [loadStore(source) for source in sources if source.endswith('.npz')]
+	if captures:
+		columnSets.append(loadCaptures(captures))
+	if not columnSets:
+		sys.exit('No captures found in ' + ', '.join(args.sources))
+	columns = mergeColumns(columnSets)
+
+	if args.save:
+		saveStore(columns, args.save)
+
+	after, failedOn = gradeColumns(columns, profiles, sataEnterpriseHours, perfProfiles)
+	if args.old:
+		oldProfiles, oldHours, oldPerfProfiles = loadProfiles(args.old)
+		before = gradeColumns(columns, oldProfiles, oldHours, oldPerfProfiles)[0]
+	else:
+		before = columns['verdict']
+
+	if args.all_snapshots:
+		rows = numpy.arange(len(columns['serial']))
+	else:
+		rows = latestPerDrive(columns)
+	elapsed = time.monotonic() - started
+
+	if args.csv:
+		writeCSV(args.csv, columns, rows, before, after, failedOn)
+	printSummary(columns, rows, before, after, failedOn, elapsed)
+
+#Only run if we were explicitly called
+if __name__ == '__main__':
+	main()
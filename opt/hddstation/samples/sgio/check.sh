@@ -0,0 +1,8 @@
+#!/bin/sh
+#Decodes the sample pages in this directory with 'sgio.py decode' and compares the result to expected.txt.
+#The pages are laid out the way drives return them (SMART READ DATA/THRESHOLDS sectors, LOG SENSE pages 0x02, 0x03, 0x05
+#and 0x0D), and include the awkward cases: vendor bytes above the hours in 9 and above the counts in 5 and 196,
+#min/max packed into 190 and 194, and a read error counter page with uncorrected errors.
+#Drop in pages saved with 'sgio.py ... --save' (and regenerate expected.txt by hand-checking against smartctl) to add more.
+cd "$(dirname "$0")" || exit 1
+python3 ../../sgio.py decode . | diff -u expected.txt - && echo "sgio decode: ok"
@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+
+#Modules
+import argparse
+import ctypes
+import fcntl
+import glob
+import os
+import re
+import struct
+
+#In-process SMART and SAS error log reader
+#Every attribute table and every SAS error log used to cost a smartctl fork, and smartctl's text then had to be parsed
+#back into numbers.  This sends the same commands smartctl does straight from python:
+#	- ATA PASS-THROUGH(16) SMART READ DATA / READ THRESHOLDS, through SG_IO, for SATA drives (including behind the toaster's USB bridge)
+#	- SCSI LOG SENSE for the write (0x02), read (0x03) and verify (0x05) error counter pages and the temperature page (0x0D), through SG_IO for drives
+#	  with a device node, or through the megaraid_sas driver's firmware pass-through for drives behind the controller
+#	  (the same path 'smartctl -d megaraid,N' takes)
+#The decoders only take bytes, so they can be checked against captured pages without a drive:
+#	sgio.py smart /dev/sdb --save captures/		read, decode and keep the raw pages
+#	sgio.py errors megaraid,12 --save captures/	same for a SAS drive's error counter pages (or errors /dev/sg3)
+#	sgio.py temperature /dev/sg3 --save captures/	same for the temperature page
+#	sgio.py decode captures/							decode whatever's in a capture directory
+#	samples/sgio/check.sh								decode the sample pages kept here and compare them to what they should say
+#Anything that goes wrong raises passthroughError or OSError, and lazysmart.py falls back to smartctl.
+
+SG_IO = 0x2285
+SG_DXFER_NONE = -1
+SG_DXFER_FROM_DEV = -3
+commandTimeout = 20000					#ms
+
+#megaraid_sas firmware pass-through - layouts from the kernel's megaraid_sas.h
+megaraidNode = '/dev/megaraid_sas_ioctl_node'
+MEGASAS_IOC_FIRMWARE = 0xC1944D01	#_IOWR('M', 1, struct megasas_iocpacket)
+MFI_CMD_PD_SCSI_IO = 0x04
+MFI_FRAME_DIR_READ = 0x0010
+MFI_STAT_DEVICE_NOT_FOUND = 0x0C
+pthruSGLOffset = 0x30
+
+#SCSI bits
+CHECK_CONDITION = 0x02
+senseKeys = {0x00:'no sense', 0x01:'recovered error', 0x02:'not ready', 0x03:'medium error', 0x04:'hardware error', 0x05:'illegal request', 0x06:'unit attention', 0x0B:'aborted command'}
+errorCounterPages = {'write': 0x02, 'read': 0x03, 'verify': 0x05}
+totalUncorrected = 0x0006			#error counter page parameter: total uncorrected errors
+temperaturePage = 0x0D
+currentTemperature = 0x0000		#temperature page parameter: current temperature in C, 0xFF if the drive doesn't know
+
+#Names for the attributes we see most.  smartctl gets its names (and some raw formats) from its drive database; we don't
+#have one, so anything not listed here is 'Unknown_Attribute', same as smartctl calls attributes it doesn't know.
+attributeNames = {1:'Raw_Read_Error_Rate', 2:'Throughput_Performance', 3:'Spin_Up_Time', 4:'Start_Stop_Count', 5:'Reallocated_Sector_Ct',
+	7:'Seek_Error_Rate', 8:'Seek_Time_Performance', 9:'Power_On_Hours', 10:'Spin_Retry_Count', 11:'Calibration_Retry_Count',
+	12:'Power_Cycle_Count', 170:'Available_Reservd_Space', 171:'Program_Fail_Count', 172:'Erase_Fail_Count', 173:'Wear_Leveling_Count',
+	174:'Unexpect_Power_Loss_Ct', 177:'Wear_Leveling_Count', 179:'Used_Rsvd_Blk_Cnt_Tot', 181:'Program_Fail_Cnt_Total',
+	182:'Erase_Fail_Count_Total', 183:'Runtime_Bad_Block', 184:'End-to-End_Error', 187:'Reported_Uncorrect', 188:'Command_Timeout',
+	189:'High_Fly_Writes', 190:'Airflow_Temperature_Cel', 191:'G-Sense_Error_Rate', 192:'Power-Off_Retract_Count', 193:'Load_Cycle_Count',
+	194:'Temperature_Celsius', 195:'Hardware_ECC_Recovered', 196:'Reallocated_Event_Count', 197:'Current_Pending_Sector',
+	198:'Offline_Uncorrectable', 199:'UDMA_CRC_Error_Count', 200:'Multi_Zone_Error_Rate', 231:'Temperature_Celsius',
+	233:'Media_Wearout_Indicator', 240:'Head_Flying_Hours', 241:'Total_LBAs_Written', 242:'Total_LBAs_Read'}
+temperatureAttributes = [194, 190, 231]	#best first.  Raw is 'current, min, max' packed into bytes - only the low byte is the temperature
+
+#How many low bits of the 48-bit raw value smartctl shows by default (its drive database's DEFAULT entry).  The rest of
+#the raw bytes are vendor extras smartctl puts in brackets, or nothing at all - e.g. Seagate keeps milliseconds above
+#the hours in 9, so reading all 48 bits turns 12000 hours into trillions.  Anything not listed is raw48, all of it.
+#	raw16(avg16), raw16(raw16): 3, 5, 196		raw24(raw8): 9, 240		tempminmax: 190, 194 (and 231, when it's a temperature)
+rawBits = {3:16, 5:16, 9:24, 190:8, 194:8, 196:16, 231:8, 240:24}
+
+
+class passthroughError(Exception): #Raised when a command doesn't come back clean
+	pass
+
+
+class sgIoHdr(ctypes.Structure): #struct sg_io_hdr from <scsi/sg.h>
+	_fields_ = [('interface_id', ctypes.c_int), ('dxfer_direction', ctypes.c_int), ('cmd_len', ctypes.c_ubyte), ('mx_sb_len', ctypes.c_ubyte),
+		('iovec_count', ctypes.c_ushort), ('dxfer_len', ctypes.c_uint), ('dxferp', ctypes.c_void_p), ('cmdp', ctypes.c_void_p),
+		('sbp', ctypes.c_void_p), ('timeout', ctypes.c_uint), ('flags', ctypes.c_uint), ('pack_id', ctypes.c_int), ('usr_ptr', ctypes.c_void_p),
+		('status', ctypes.c_ubyte), ('masked_status', ctypes.c_ubyte), ('msg_status', ctypes.c_ubyte), ('sb_len_wr', ctypes.c_ubyte),
+		('host_status', ctypes.c_ushort), ('driver_status', ctypes.c_ushort), ('resid', ctypes.c_int), ('duration', ctypes.c_uint), ('info', ctypes.c_uint)]
+
+
+class iovec(ctypes.Structure):
+	_fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class megasasIocPacket(ctypes.Structure): #struct megasas_iocpacket - header, one 128-byte MFI frame, and up to 16 iovecs
+	_pack_ = 1
+	_fields_ = [('host_no', ctypes.c_ushort), ('pad', ctypes.c_ushort), ('sgl_off', ctypes.c_uint), ('sge_count', ctypes.c_uint),
+		('sense_off', ctypes.c_uint), ('sense_len', ctypes.c_uint), ('frame', ctypes.c_ubyte * 128), ('sgl', iovec * 16)]
+
+
+#Helper functions
+#Function to check sense data.  Returns quietly for no sense, recovered errors and 'ATA pass-through information available'.
+def checkSense(sense):
+	if len(sense) < 3:
+		return
+	if sense[0] & 0x7F in (0x72, 0x73): #descriptor format
+		key, asc, ascq = sense[1] & 0x0F, sense[2], sense[3] if len(sense) > 3 else 0
+	else:
+		key, asc, ascq = sense[2] & 0x0F, sense[12] if len(sense) > 12 else 0, sense[13] if len(sense) > 13 else 0
+	if key in (0x00, 0x01):
+		return
+	raise passthroughError(senseKeys.get(key, 'sense key ' + hex(key)) + ' (asc ' + hex(asc) + ', ascq ' + hex(ascq) + ')')
+
+def ataSMARTCDB(feature): #ATA PASS-THROUGH(16), PIO data-in, one 512-byte sector, SMART command with the given feature
+	return bytes([0x85, 4 << 1, 0x0E, 0, feature, 0, 1, 0, 0, 0, 0x4F, 0, 0xC2, 0, 0xB0, 0])
+
+def logSenseCDB(page, length): #LOG SENSE for cumulative values of a page
+	return bytes([0x4D, 0, 0x40 | page, 0, 0, 0, 0, length >> 8, length & 0xFF, 0])
+
+
+class sgTransport(): #Sends CDBs to a /dev/sdX or /dev/sgN node through SG_IO
+	def __init__(self, path):
+		self.path = path
+
+	def command(self, cdb, length): #Sends a data-in command and returns what came back
+		data = ctypes.create_string_buffer(length)
+		sense = ctypes.create_string_buffer(32)
+		cdbBuffer = ctypes.create_string_buffer(bytes(cdb), len(cdb))
+		header = sgIoHdr(interface_id = ord('S'), dxfer_direction = SG_DXFER_FROM_DEV if length else SG_DXFER_NONE, cmd_len = len(cdb),
+			mx_sb_len = len(sense), dxfer_len = length, dxferp = ctypes.addressof(data), cmdp = ctypes.addressof(cdbBuffer),
+			sbp = ctypes.addressof(sense), timeout = commandTimeout)
+
+		fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+		try:
+			fcntl.ioctl(fd, SG_IO, header)
+		finally:
+			os.close(fd)
+
+		if header.host_status:
+			raise passthroughError('host status ' + hex(header.host_status))
+		if header.status == CHECK_CONDITION or header.sb_len_wr:
+			checkSense(sense.raw[:header.sb_len_wr])
+		elif header.status:
+			raise passthroughError('SCSI status ' + hex(header.status))
+		return data.raw[:length - header.resid]
+
+
+class megaraidTransport(): #Sends CDBs to a physical drive behind a megaraid_sas controller, by device ID
+	def __init__(self, deviceID, host=None):
+		self.deviceID = int(deviceID)
+		self.host = scsiHost('sda') if host is None else host #the station's controller is the one the OS lives on
+
+	def command(self, cdb, length):
+		data = ctypes.create_string_buffer(max(length, 1))
+		packet = megasasIocPacket()
+		frame = bytearray(128)
+		struct.pack_into('<BBBBBBBB', frame, 0, MFI_CMD_PD_SCSI_IO, 0, 0xFF, 0, self.deviceID, 0, len(cdb), 1 if length else 0)
+		struct.pack_into('<HHI', frame, 0x10, MFI_FRAME_DIR_READ if length else 0, 0, length)
+		frame[0x20:0x20 + len(cdb)] = cdb
+		if length:
+			struct.pack_into('<II', frame, pthruSGLOffset, ctypes.addressof(data) & 0xFFFFFFFF, length) #the driver swaps in its own DMA address
+			packet.sge_count = 1
+			packet.sgl_off = pthruSGLOffset
+			packet.sgl[0].iov_base = ctypes.addressof(data)
+			packet.sgl[0].iov_len = length
+		packet.frame[:] = frame
+		packet.host_no = self.host
+
+		fd = os.open(megaraidNode if os.path.exists(megaraidNode) else makeMegaraidNode(), os.O_RDWR)
+		try:
+			fcntl.ioctl(fd, MEGASAS_IOC_FIRMWARE, packet)
+		finally:
+			os.close(fd)
+
+		status = packet.frame[2]
+		if status == MFI_STAT_DEVICE_NOT_FOUND:
+			raise passthroughError('no drive with device ID ' + str(self.deviceID))
+		if status:
+			raise passthroughError('controller status ' + hex(status) + ', SCSI status ' + hex(packet.frame[3]))
+		return data.raw[:length]
+
+
+def scsiHost(blockName): #Returns the SCSI host number a block device hangs off, e.g. 0 for .../host0/target0:2:0/0:2:0:0
+	match = re.search(r'/host(\d+)/', os.path.realpath('/sys/block/' + blockName + '/device'))
+	if not match:
+		raise passthroughError("can't find the SCSI host for " + blockName)
+	return int(match.group(1))
+
+def makeMegaraidNode(): #Makes the megaraid_sas ioctl node if udev didn't, like smartctl does
+	with open('/proc/devices') as devices:
+		for line in devices:
+			fields = line.split()
+			if len(fields) == 2 and fields[1] == 'megaraid_sas_ioctl':
+				os.mknod(megaraidNode, 0o600 | 0o020000, os.makedev(int(fields[0]), 0))
+				return megaraidNode
+	raise passthroughError('megaraid_sas driver not loaded')
+
+def transport(target): #Returns a transport for '/dev/sdX', '/dev/sgN' or 'megaraid,N'
+	if target.startswith('megaraid,'):
+		return megaraidTransport(target.split(',', 1)[1])
+	return sgTransport(target)
+
+
+#Decoders - bytes in, the structures lazysmart and drivetest already use out
+#Function to decode SMART READ DATA and READ THRESHOLDS sectors into rows in smartctl '-A' column order:
+#(num, name, flags, value, worst, thresh, type, updated, when_failed, raw), all strings, like smartctl prints them.
+def decodeSMARTAttributes(data, thresholds=None):
+	if len(data) < 512:
+		raise passthroughError('SMART data is ' + str(len(data)) + ' bytes, expected 512')
+	if sum(data[:512]) & 0xFF:
+		raise passthroughError('SMART data checksum is bad')
+
+	limits = {}
+	if thresholds and len(thresholds) >= 512 and not sum(thresholds[:512]) & 0xFF:
+		for entry in range(30):
+			num, limit = struct.unpack_from('<BB', thresholds, 2 + entry * 12)
+			if num:
+				limits[num] = limit
+
+	rows = []
+	for entry in range(30):
+		num, flags, value, worst = struct.unpack_from('<BHBB', data, 2 + entry * 12)
+		if not num:
+			continue
+		raw = int.from_bytes(data[2 + entry * 12 + 5:2 + entry * 12 + 11], 'little')
+		if num in rawBits:
+			raw = raw & ((1 << rawBits[num]) - 1) #the number smartctl leads with - grading and the captures only ever look at that
+		thresh = limits.get(num, 0)
+		whenFailed = 'FAILING_NOW' if thresh and value <= thresh else ('In_the_past' if thresh and worst <= thresh else '-')
+		rows.append((str(num), attributeNames.get(num, 'Unknown_Attribute'), '0x%04x' % flags, '%03d' % value, '%03d' % worst, '%03d' % thresh,
+			'Pre-fail' if flags & 0x01 else 'Old_age', 'Always' if flags & 0x02 else 'Offline', whenFailed, str(raw)))
+	return rows
+
+#Function to decode a LOG SENSE page into {parameter code: value}
+def decodeLogPage(page, expected=None):
+	if len(page) < 4:
+		raise passthroughError('log page is ' + str(len(page)) + ' bytes')
+	if expected is not None and page[0] & 0x3F != expected:
+		raise passthroughError('asked for log page ' + hex(expected) + ', got ' + hex(page[0] & 0x3F))
+	end = min(len(page), 4 + struct.unpack_from('>H', page, 2)[0])
+	parameters = {}
+	offset = 4
+	while offset + 4 <= end:
+		code, control, length = struct.unpack_from('>HBB', page, offset)
+		parameters[code] = int.from_bytes(page[offset + 4:offset + 4 + length], 'big')
+		offset += 4 + length
+	return parameters
+
+#Function to turn the three error counter pages into the counters sasErrorLog returns.  pages is {'read': bytes, ...};
+#a missing or undecodable page gives -1 and sets warn, same as a short smartctl log.
+def decodeErrorCounters(pages):
+	counters = {}
+	warn = False
+	for name, code in errorCounterPages.items():
+		try:
+			counters['uncorrectable_' + name + '_errors'] = decodeLogPage(pages[name], code)[totalUncorrected]
+		except (KeyError, passthroughError):
+			counters['uncorrectable_' + name + '_errors'] = -1
+			warn = True
+	return counters, warn
+
+
+#Function to get the current temperature out of a temperature log page.  Returns None if the drive doesn't know it.
+def decodeTemperaturePage(page):
+	current = decodeLogPage(page, temperaturePage).get(currentTemperature, 0xFF) & 0xFF
+	return None if current == 0xFF else current
+
+#Function to get the temperature out of decoded SMART attribute rows.  194 is the usual one; some drives only have 190.
+def attributeTemperature(rows):
+	found = {int(fields[0]): int(fields[9]) for fields in rows if int(fields[0]) in temperatureAttributes}
+	for num in temperatureAttributes:
+		if num in found:
+			return found[num]
+	return None
+
+
+#Readers - send the commands and hand the answers to the decoders
+#Function to read the SMART data and threshold sectors.  Returns (data, thresholds).
+def readSMARTPages(target):
+	device = transport(target)
+	data = device.command(ataSMARTCDB(0xD0), 512)
+	try:
+		thresholds = device.command(ataSMARTCDB(0xD1), 512)
+	except passthroughError:
+		thresholds = None #obsolete since ATA-8, so some drives don't answer.  Thresholds show as 000.
+	return data, thresholds
+
+def readSMARTAttributes(target):
+	return decodeSMARTAttributes(*readSMARTPages(target))
+
+#Function to read the write/read/verify error counter pages.  Returns {'write': bytes, ...}; pages the drive won't give us are left out.
+def readErrorCounterPages(target):
+	device = transport(target)
+	pages = {}
+	for name, code in errorCounterPages.items():
+		try:
+			pages[name] = device.command(logSenseCDB(code, 1024), 1024)
+		except passthroughError:
+			pass
+	if not pages:
+		raise passthroughError(target + ' gave us none of the error counter pages')
+	return pages
+
+def readErrorCounters(target):
+	return decodeErrorCounters(readErrorCounterPages(target))
+
+
+#Function to read a drive's temperature: from the SMART attributes for ATA drives, the temperature page for SCSI ones.  One command either way.
+def readTemperature(target, ata=False):
+	if ata:
+		return attributeTemperature(decodeSMARTAttributes(transport(target).command(ataSMARTCDB(0xD0), 512)))
+	return decodeTemperaturePage(transport(target).command(logSenseCDB(temperaturePage, 64), 64))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Read SMART attributes or SAS error counters without smartctl')
+	parser.add_argument('what', choices=['smart', 'errors', 'temperature', 'decode'])
+	parser.add_argument('target', help="/dev/sdX, /dev/sgN, megaraid,N - or a capture directory for 'decode'")
+	parser.add_argument('--save', help='directory to keep the raw pages in')
+	args = parser.parse_args()
+
+	if args.what == 'decode':
+		pages = {os.path.basename(name)[:-4]: open(name, 'rb').read() for name in glob.glob(os.path.join(args.target, '*.bin'))}
+	elif args.what == 'smart':
+		data, thresholds = readSMARTPages(args.target)
+		pages = {'smart_data': data, 'smart_thresholds': thresholds or b''}
+	elif args.what == 'temperature':
+		pages = {'temperature': transport(args.target).command(logSenseCDB(temperaturePage, 64), 64)}
+	else:
+		pages = readErrorCounterPages(args.target)
+
+	if args.save:
+		os.makedirs(args.save, exist_ok=True)
+		for name, page in pages.items():
+			with open(os.path.join(args.save, name + '.bin'), 'wb') as out:
+				out.write(page)
+
+	if 'smart_data' in pages:
+		print('ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE')
+		for row in decodeSMARTAttributes(pages['smart_data'], pages.get('smart_thresholds')):
+			print('%3s %-23s %-8s %-5s %-5s %-6s %-9s %-8s %-11s %s' % row)
+	if any(name in pages for name in errorCounterPages):
+		counters, warn = decodeErrorCounters(pages)
+		for name, count in counters.items():
+			print(name + ': ' + str(count))
+		if warn:
+			print('(some pages were missing or unreadable)')
+	if 'temperature' in pages:
+		print('temperature: ' + str(decodeTemperaturePage(pages['temperature'])) + 'C')
+
+#Only run if we were explicitly called
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+#Modules
+import contextlib
+import threading
+import time
+
+#Thermal governor
+#Zeroing or surface-scanning a toaster full of drives at once cooks them.  Past their limit, drives protect themselves by
+#retrying, stalling and slowing right down (and some just drop off the bus), so a batch that runs flat out until it's hot
+#ends up slower than one that's held just under the limit.
+#The governor reads every watched drive's temperature every sampleInterval seconds and gives each job a rate:
+#	- at or over the ceiling: cut it to backoff x what the job has been doing
+#	- more than hysteresis under the ceiling: raise it by recovery, until it's back to no limit at all
+#	- in between: hold it
+#Jobs call throttle.pace(bytes) after every chunk, and pace sleeps just long enough to hold them to their rate.  Jobs we
+#can't pace (controller inits) can call throttle.waitUntilCool(timeout) before they start instead - give it a timeout, since a
+#drive in a warm chassis can sit just under the ceiling for good.
+#Like intake.py, this doesn't know anything about SMART - it's handed a function that reads each drive's temperature.
+
+
+class driveThrottle(): #One job's handle on the governor
+	def __init__(self, key, reader):
+		self.key = key							#what the UI calls the drive, e.g. 'Toaster Slot 1'
+		self.reader = reader				#returns the drive's temperature in C, or None
+		self.temperature = None
+		self.rate = None						#bytes per second this job may move, or None for flat out
+		self.peak = 0								#fastest the job has gone while unthrottled, so we know when to let go
+		self.moved = 0
+		self.nextAllowed = time.monotonic()
+		self.lastSample = (time.monotonic(), 0)
+		self.cooled = threading.Event()
+		self.cooled.set()
+
+	def pace(self, count): #Call after moving count bytes.  Sleeps if the job is ahead of its rate.
+		self.moved += count
+		rate = self.rate
+		now = time.monotonic()
+		if not rate:
+			self.nextAllowed = now
+			return
+		self.nextAllowed = max(self.nextAllowed, now) + count / rate
+		if self.nextAllowed > now:
+			time.sleep(self.nextAllowed - now)
+
+	def waitUntilCool(self, timeout=None): #Blocks while the drive is over the ceiling, until it's cooled to hysteresis under it (or stops answering).  Returns False on timeout.
+		return self.cooled.wait(timeout)
+
+
+class thermalGovernor():
+	def __init__(self, ceiling, hysteresis=3, sampleInterval=30, backoff=0.7, recovery=1.15, minimumRate=5 * 1000 * 1000):
+		#ceiling is in C.  None still samples (for the UI) but never slows anything down.
+		self.ceiling = ceiling
+		self.hysteresis = hysteresis
+		self.sampleInterval = sampleInterval
+		self.backoff = backoff
+		self.recovery = recovery
+		self.minimumRate = minimumRate
+		self.throttles = {}
+		self.temperatures = {}			#last reading for every drive we've watched, by key - kept after the job ends, for the UI
+		self.lock = threading.Lock()
+		self.sampler = None
+
+	@contextlib.contextmanager
+	def watch(self, key, reader): #'with governor.watch(key, reader) as throttle:' - samples the drive and paces the job for the length of the block
+		throttle = driveThrottle(key, reader)
+		self.sample(throttle)
+		with self.lock:
+			self.throttles[key] = throttle
+			if not self.sampler or not self.sampler.is_alive():
+				self.sampler = threading.Thread(target=self.loop, daemon=True)
+				self.sampler.start()
+		try:
+			yield throttle
+		finally:
+			with self.lock:
+				if self.throttles.get(key) is throttle:
+					del self.throttles[key]
+
+	def temperature(self, key): #Returns the last temperature read for a drive, or None
+		return self.temperatures.get(key)
+
+	def loop(self): #Samples everything being watched, every sampleInterval seconds, until nothing is
+		while True:
+			time.sleep(self.sampleInterval)
+			with self.lock:
+				throttles = list(self.throttles.values())
+				if not throttles:
+					self.sampler = None
+					return
+			for throttle in throttles:
+				self.sample(throttle)
+
+	def sample(self, throttle): #Reads one drive's temperature and works out its job's new rate
+		try:
+			temperature = throttle.reader()
+		except Exception:
+			temperature = None #a drive that won't say keeps whatever rate it had
+		now = time.monotonic()
+		lastTime, lastMoved = throttle.lastSample
+		observed = (throttle.moved - lastMoved) / max(now - lastTime, 1e-6)
+		throttle.lastSample = (now, throttle.moved)
+		if throttle.rate is None:
+			throttle.peak = max(throttle.peak, observed)
+
+		throttle.temperature = temperature
+		if temperature is None:
+			throttle.cooled.set() #a drive we can't read (pulled, or erroring) mustn't leave its job waiting for a reading that never comes
+			return
+		self.temperatures[throttle.key] = temperature
+		if self.ceiling is None:
+			return
+
+		if temperature >= self.ceiling:
+			throttle.cooled.clear()
+			current = throttle.rate or observed
+			if current:
+				throttle.rate = max(self.minimumRate, current * self.backoff)
+		elif temperature < self.ceiling - self.hysteresis:
+			throttle.cooled.set()
+			if throttle.rate:
+				throttle.rate *= self.recovery
+				if throttle.rate >= throttle.peak:
+					throttle.rate = None